@@ -3,33 +3,11 @@ warnings.filterwarnings("ignore")
 
 import os
 import streamlit as st
-import google.generativeai as genai
 from dotenv import load_dotenv
 import re
 import uuid
 from datetime import datetime
 import sys
-import json
-
-# Load environment variables
-load_dotenv()
-
-# Configure the Gemini API
-api_key = os.getenv("GEMINI")
-if not api_key:
-    st.error("GEMINI_API_KEY is not set in the .env file!")
-    st.stop()
-
-# Configure the generative AI model
-try:
-    genai.configure(api_key=api_key)
-    # Use the correct free model name - gemini-1.5-flash instead of gemini-pro
-    model = genai.GenerativeModel('gemini-1.5-flash')
-except Exception as e:
-    st.error(f"Error configuring Gemini API: {str(e)}")
-    st.error("If you see a model not found error, you may need to check the available models.")
-    st.info("For free tier, try using 'gemini-1.5-flash' instead of 'gemini-pro'")
-    st.stop()
 
 # App title and styling
 st.set_page_config(
@@ -38,127 +16,82 @@ st.set_page_config(
     layout="wide",
 )
 
-# Custom CSS for dark blue theme
-st.markdown("""
-<style>
-    .main {
-        background-color: #0d1b2a;
-        color: #e0e1dd;
-    }
-    .stTextInput, .stTextArea {
-        background-color: #1b263b;
-        color: #e0e1dd;
-        border-radius: 10px;
-    }
-    .stButton>button {
-        background-color: #415a77;
-        color: #e0e1dd;
-        border-radius: 10px;
-    }
-    .stButton>button:hover {
-        background-color: #778da9;
-    }
-    .chat-container {
-        padding: 10px;
-        border-radius: 10px;
-        margin-bottom: 10px;
-    }
-    .user-message {
-        background-color: #1b263b;
-        padding: 15px;
-        border-radius: 10px;
-        margin-bottom: 10px;
-    }
-    .assistant-message {
-        background-color: #415a77;
-        padding: 15px;
-        border-radius: 10px;
-        margin-bottom: 10px;
-    }
-    .code-block {
-        background-color: #1e1e1e;
-        padding: 15px;
-        border-radius: 5px;
-        margin-top: 10px;
-        margin-bottom: 10px;
-        overflow-x: auto;
-        font-family: 'Courier New', monospace;
-    }
-    .delete-btn {
-        color: #e0e1dd;
-        background-color: transparent;
-        border: none;
-        cursor: pointer;
-        float: right;
-    }
-    .delete-btn:hover {
-        color: #ff6b6b;
-    }
-    .timestamp {
-        font-size: 0.8em;
-        color: #adb5bd;
-        margin-top: 5px;
-    }
-    .header {
-        display: flex;
-        justify-content: space-between;
-        align-items: center;
-        padding: 10px 0;
-    }
-    .session-item {
-        background-color: #1b263b;
-        padding: 10px;
-        border-radius: 5px;
-        margin-bottom: 5px;
-        cursor: pointer;
-    }
-    .session-item:hover {
-        background-color: #415a77;
-    }
-    .session-title {
-        font-weight: bold;
-    }
-    .session-date {
-        font-size: 0.8em;
-        color: #adb5bd;
-    }
-    .active-session {
-        border-left: 4px solid #4caf50;
-    }
-    .session-actions {
-        display: flex;
-        gap: 5px;
-        margin-top: 5px;
-    }
-    .session-action-btn {
-        background-color: #415a77;
-        color: #e0e1dd;
-        border: none;
-        padding: 2px 5px;
-        border-radius: 3px;
-        cursor: pointer;
-        font-size: 0.8em;
-    }
-    .session-action-btn:hover {
-        background-color: #778da9;
-    }
-    .notification {
-        position: fixed;
-        top: 10px;
-        right: 10px;
-        padding: 10px;
-        background-color: #4caf50;
-        color: white;
-        border-radius: 5px;
-        z-index: 1000;
-    }
-</style>
-""", unsafe_allow_html=True)
+# Stylesheet for the app, relative to this script
+CSS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "codecraft.css")
+
+# Function to load environment variables once per process; the engine
+# reads its settings when first imported, so this runs before that
+@st.cache_resource(show_spinner=False)
+def load_environment():
+    load_dotenv()
+
+# Function to read the stylesheet once per process, without comments and
+# indentation to keep every run's page delta small
+@st.cache_resource(show_spinner=False)
+def load_css():
+    with open(CSS_FILE) as f:
+        css = re.sub(r"/\*.*?\*/", "", f.read(), flags=re.S)
+    css = re.sub(r"\s*([{};:,])\s*", r"\1", css)
+    return "<style>" + " ".join(css.split()) + "</style>"
+
+load_environment()
+
+import background
+import engine
+import prompts
+from code_blocks import StreamingCodeBlockParser, cached_code_blocks
+
+# Check the model API settings; the Gemini SDK itself is imported and
+# configured on the first generation
+try:
+    engine.check_configuration()
+except engine.ConfigurationError as e:
+    st.error(str(e))
+    st.stop()
 
-# Define the data storage path
-SESSION_DATA_FILE = "codecraft_sessions.json"
+# Custom CSS for dark blue theme; read and minified once per process, but
+# emitted on every run since Streamlit drops elements a run doesn't emit
+st.markdown(load_css(), unsafe_allow_html=True)
+
+# Render responses token by token as they arrive (set to 0 to disable)
+STREAM_RESPONSES = os.getenv("CODECRAFT_STREAM", "1") != "0"
+
+# How long a request waits for a background summary update before using the
+# previous summary
+SUMMARY_WAIT = 5
+
+# Chat history rendering: messages shown per page, and the element budget
+# per page; messages past the budget are shown as one-line previews
+HISTORY_WINDOW = 20
+MAX_ELEMENTS_PER_RUN = 150
+
+# Sessions listed in the sidebar at first, and added by each "Show more"
+SIDEBAR_PAGE_SIZE = 25
+
+# Placeholder emails Streamlit reports when the app runs without sign-in
+LOCAL_USER_EMAILS = {"test@example.com", "test@localhost.com"}
+
+# Function to work out whose sessions this browser session works with: the
+# signed-in user's email when the deployment has authentication, else a
+# ?user= query parameter, else the shared default user. The query parameter
+# only partitions sessions; it is not authentication.
+def detect_user():
+    try:
+        email = st.experimental_user.email
+    except Exception:
+        email = None
+    if email and email not in LOCAL_USER_EMAILS:
+        return email
+    
+    user = st.experimental_get_query_params().get("user", [None])[0]
+    if user and user.strip():
+        return user.strip()
+    return engine.DEFAULT_USER
 
 # Initialize session state
+if 'user_key' not in st.session_state:
+    st.session_state.user_key = detect_user()
+
 if 'chat_history' not in st.session_state:
     st.session_state.chat_history = []
 
@@ -174,138 +107,254 @@ if 'current_session_id' not in st.session_state:
 if 'notification' not in st.session_state:
     st.session_state.notification = None
 
+if 'pending_title' not in st.session_state:
+    st.session_state.pending_title = None
+
+if 'pending_summary' not in st.session_state:
+    st.session_state.pending_summary = None
+
+if 'summary' not in st.session_state:
+    st.session_state.summary = None
+
+if 'prompt_template' not in st.session_state:
+    st.session_state.prompt_template = engine.get_template().name
+
+if 'history_window' not in st.session_state:
+    st.session_state.history_window = HISTORY_WINDOW
+
+if 'sidebar_limit' not in st.session_state:
+    st.session_state.sidebar_limit = SIDEBAR_PAGE_SIZE
+
 # Function to reset the input field
 def reset_input():
     st.session_state.input_key = str(uuid.uuid4())
 
-# Function to detect code in a response
-def extract_code_blocks(text):
-    # Regular expression to match markdown code blocks
-    pattern = r"```([\w\+\#]*)?\n([\s\S]*?)\n```"
-    
-    # Find all code blocks
-    matches = re.findall(pattern, text)
-    
-    if not matches:
-        return [("", text)]  # No code blocks found
-    
-    result = []
-    last_end = 0
-    
-    for match in re.finditer(pattern, text):
-        # Add text before code block
-        if match.start() > last_end:
-            result.append(("", text[last_end:match.start()]))
-        
-        # Add code block with language
-        language = match.group(1).strip() if match.group(1) else ""
-        code = match.group(2)
-        result.append((language, code))
-        
-        last_end = match.end()
+# Function to render text and code segments into the current container
+def render_content_blocks(segments):
+    for language, block, is_code in segments:
+        if is_code:  # This is a code block
+            st.code(block, language=language or None)
+        else:  # This is regular text
+            st.markdown(block)
+
+# Function to count the Streamlit elements a message renders
+def message_element_count(message):
+    if message['role'] == 'user':
+        return 1
+    return 2 + len(cached_code_blocks(message['id'], message['content']))
+
+# Function to display a single chat message
+def render_message(message):
+    with st.container():
+        if message['role'] == 'user':
+            st.markdown(f"""
+            <div class='chat-container'>
+                <div class='header'>
+                    <strong>You</strong>
+                </div>
+                <div class='user-message'>
+                    {message['content']}
+                    <div class='timestamp'>{message['timestamp']}</div>
+                </div>
+            </div>
+            """, unsafe_allow_html=True)
+        else:
+            st.markdown(f"""
+            <div class='chat-container'>
+                <div class='header'>
+                    <strong>CodeCraft AI</strong>
+                </div>
+                <div class='assistant-message'>
+            """, unsafe_allow_html=True)
+            
+            # Process and display content with code blocks
+            render_content_blocks(cached_code_blocks(message['id'], message['content']))
+            
+            st.markdown(f"""
+                    <div class='timestamp'>{message['timestamp']}</div>
+                </div>
+            </div>
+            """, unsafe_allow_html=True)
+
+# Function to display a message as a single-line preview
+def render_collapsed_message(message):
+    author = "You" if message['role'] == 'user' else "CodeCraft AI"
+    preview = " ".join(message['content'].split())[:120]
+    st.caption(f"{author} · {message['timestamp']} — {preview}…")
+
+# Function to display the most recent page(s) of the chat history
+def show_chat_history():
+    history = st.session_state.chat_history
+    window = st.session_state.history_window
+    window_start = max(0, len(history) - window)
+    
+    # Loading earlier pages raises the element budget along with the window
+    budget = MAX_ELEMENTS_PER_RUN * max(1, window // HISTORY_WINDOW)
+    
+    # Walk back from the newest message; the newest always renders in full
+    full_start = len(history)
+    for idx in range(len(history) - 1, window_start - 1, -1):
+        cost = message_element_count(history[idx])
+        if cost > budget and full_start < len(history):
+            break
+        budget -= cost
+        full_start = idx
+    
+    if window_start > 0:
+        if st.button(f"Load earlier messages ({window_start} more)"):
+            st.session_state.history_window = window + HISTORY_WINDOW
+            st.rerun()
     
-    # Add any remaining text after the last code block
-    if last_end < len(text):
-        result.append(("", text[last_end:]))
+    for message in history[window_start:full_start]:
+        render_collapsed_message(message)
     
-    return result
+    for message in history[full_start:]:
+        render_message(message)
 
-# Function to delete a chat message
-def delete_message(message_id):
-    st.session_state.chat_history = [msg for msg in st.session_state.chat_history if msg['id'] != message_id]
+# Function to remove messages from the chat history and the current
+# session's stored messages
+def remove_messages(message_ids):
+    message_ids = set(message_ids)
+    st.session_state.chat_history = [msg for msg in st.session_state.chat_history if msg['id'] not in message_ids]
     
     # Update the current session with the modified chat history
     if st.session_state.current_session_id:
+        try:
+            engine.delete_messages(st.session_state.current_session_id, message_ids, current_user())
+        except Exception as e:
+            st.error(f"Error saving sessions: {str(e)}")
         save_current_session()
-        
+
+# Function to delete a chat message
+def delete_message(message_id):
+    remove_messages([message_id])
     st.rerun()
 
-# Function to check if prompt is requesting code
-def is_code_request(prompt):
-    # List of code-related keywords
-    code_keywords = [
-        'code', 'function', 'program', 'script', 'algorithm', 'class', 'method',
-        'implement', 'develop', 'build', 'create a', 'write a', 'generate a',
-        'python', 'javascript', 'html', 'css', 'java', 'c++', 'c#', 'ruby', 'php',
-        'typescript', 'swift', 'kotlin', 'rust', 'go', 'dart', 'react', 'angular',
-        'vue', 'node', 'django', 'flask', 'express', 'api', 'database', 'sql',
-        'mongodb', 'json', 'xml', 'app', 'application', 'git', 'docker', 'aws',
-        'azure', 'tensorflow', 'pytorch', 'numpy', 'pandas', 'scikit', 'matplotlib',
-        'selenium', 'beautiful soup', 'regex', 'rest', 'graphql', 'web scraping'
-    ]
-    
-    # Non-code patterns (questions about theory, explanations, etc.)
-    non_code_patterns = [
-        r'explain about', r'what is', r'tell me about', r'how does', r'describe',
-        r'history of', r'difference between', r'compare', r'advantages of',
-        r'disadvantages', r'pros and cons', r'benefits of', r'drawbacks of',
-        r'when to use', r'why use', r'definition of', r'meaning of', r'features of',
-        r'characteristics', r'theory', r'concept', r'principles', r'explain'
-    ]
-    
-    # Check if the prompt contains any code-related keywords
-    has_code_keywords = any(keyword.lower() in prompt.lower() for keyword in code_keywords)
-    
-    # Check if the prompt matches any non-code patterns
-    is_non_code_request = any(re.search(pattern, prompt.lower()) for pattern in non_code_patterns)
-    
-    # Return True if it has code keywords and doesn't match non-code patterns
-    return has_code_keywords and not is_non_code_request
-
-# Function to generate auto session title
-def generate_session_title(first_message):
+# Function to apply a background-generated session title once it is ready
+def apply_pending_title():
+    pending = st.session_state.pending_title
+    if not pending or not pending['future'].done():
+        return
+    
+    st.session_state.pending_title = None
+    session = st.session_state.sessions.get(pending['session_id'])
+    
+    # Skip sessions that were deleted or renamed in the meantime
+    if session and session['title'].startswith("New Session"):
+        rename_session(pending['session_id'], pending['future'].result())
+
+# Function to get the rolling summary of older turns for a session
+def get_session_summary(session_id):
+    summary = st.session_state.summary
+    if not summary or summary['session_id'] != session_id:
+        summary = engine.load_summary(session_id, current_user())
+        st.session_state.summary = summary
+    return summary
+
+# Function to apply a background summary update once it is ready
+def apply_pending_summary(wait=0):
+    pending = st.session_state.pending_summary
+    if not pending:
+        return
+    
     try:
-        prompt = f"""
-        Create a short, concise title (3-5 words) that summarizes the following message content. 
-        The title should be specific enough to identify the general topic but brief enough to serve as a chat session name.
-        
-        Message: {first_message}
-        
-        Return ONLY the title with no quotes, explanation, or additional text.
-        """
-        
-        generation_config = {
-            "temperature": 0.2,
-            "top_p": 0.95,
-            "top_k": 32,
-            "max_output_tokens": 20,
-        }
-        
-        response = model.generate_content(
-            prompt,
-            generation_config=generation_config
-        )
-        
-        title = response.text.strip()
-        
-        # Limit length and clean up title
-        if len(title) > 50:
-            title = title[:47] + "..."
-            
-        return title
+        summary = pending['future'].result(timeout=wait)
+    except TimeoutError:
+        return
     except Exception as e:
-        # Fallback title with timestamp
-        return f"CodeCraft Session {datetime.now().strftime('%b %d, %H:%M')}"
+        summary = None
+        st.error(f"Error saving sessions: {str(e)}")
+    
+    st.session_state.pending_summary = None
+    if summary:
+        st.session_state.summary = summary
+
+# Function to start summarizing turns that no longer fit the context budget;
+# runs in the background after a response so the next request doesn't wait
+def schedule_summary_update():
+    session_id = st.session_state.current_session_id
+    if not session_id or st.session_state.pending_summary:
+        return
+    
+    history = list(st.session_state.chat_history)
+    summary = get_session_summary(session_id)
+    covered, start = engine.summary_backlog(summary, history)
+    
+    if start > covered:
+        st.session_state.pending_summary = {
+            'session_id': session_id,
+            'future': background.submit(engine.refresh_summary, summary, history, current_user())
+        }
 
-# Function to load sessions from file
+# Function to build the conversation context sent with a request
+def build_request_context(history):
+    session_id = st.session_state.current_session_id
+    if not session_id or not history:
+        return ""
+    
+    apply_pending_summary(wait=SUMMARY_WAIT)
+    return engine.build_request_context(history, get_session_summary(session_id))
+
+# Function to load the session index (metadata only) from the session store
 def load_sessions():
     try:
-        if os.path.exists(SESSION_DATA_FILE):
-            with open(SESSION_DATA_FILE, 'r') as f:
-                sessions_data = json.load(f)
-                return sessions_data
-        return {}
+        return engine.load_sessions(current_user())
     except Exception as e:
         st.error(f"Error loading sessions: {str(e)}")
         return {}
 
-# Function to save sessions to file
-def save_sessions():
+# Function to fetch a session's messages on demand
+def load_session_messages(session_id):
+    try:
+        return engine.load_session_messages(session_id, current_user())
+    except Exception as e:
+        st.error(f"Error loading sessions: {str(e)}")
+        return []
+
+# Function to get a page of sessions, most recently updated first
+def recent_sessions(limit, offset=0):
+    try:
+        return engine.recent_sessions(current_user(), limit, offset)
+    except Exception as e:
+        st.error(f"Error loading sessions: {str(e)}")
+        return [], 0
+
+# Function to save a single session to the session store. The session index
+# in st.session_state.sessions is shared with other tabs, so changes are made
+# to a copy and the index is re-read after the store has been updated.
+def save_sessions(session, messages=None):
+    try:
+        engine.save_session(session, messages, current_user())
+    except Exception as e:
+        st.error(f"Error saving sessions: {str(e)}")
+    st.session_state.sessions = load_sessions()
+
+# Function to rename a session in the session store
+def rename_stored_session(session_id, new_title):
     try:
-        with open(SESSION_DATA_FILE, 'w') as f:
-            json.dump(st.session_state.sessions, f)
+        engine.rename_session(session_id, new_title, current_user())
     except Exception as e:
         st.error(f"Error saving sessions: {str(e)}")
+    st.session_state.sessions = load_sessions()
+
+# Function to remove a session from the session store; returns whether it
+# was removed
+def delete_stored_session(session_id):
+    try:
+        engine.delete_session(session_id, current_user())
+    except Exception as e:
+        st.error(f"Error saving sessions: {str(e)}")
+        return False
+    st.session_state.sessions = load_sessions()
+    return True
+
+# Function to search the stored sessions
+def search_sessions(query):
+    try:
+        return engine.search_sessions(query, current_user())
+    except Exception as e:
+        st.error(f"Error searching sessions: {str(e)}")
+        return []
 
 # Function to save the current session
 def save_current_session():
@@ -313,37 +362,31 @@ def save_current_session():
         session_id = st.session_state.current_session_id
         
         # Update the session data
-        st.session_state.sessions[session_id]['messages'] = st.session_state.chat_history
-        st.session_state.sessions[session_id]['last_updated'] = datetime.now().isoformat()
+        session = dict(st.session_state.sessions[session_id], last_updated=datetime.now().isoformat())
         
-        # Save to file
-        save_sessions()
+        # Save only this session's changes
+        save_sessions(session, st.session_state.chat_history)
 
 # Function to create a new session
 def create_new_session(title=None):
-    session_id = str(uuid.uuid4())
-    timestamp = datetime.now().isoformat()
-    
-    # Create a new session entry
-    st.session_state.sessions[session_id] = {
-        'id': session_id,
-        'title': title if title else f"New Session {datetime.now().strftime('%b %d, %H:%M')}",
-        'created_at': timestamp,
-        'last_updated': timestamp,
-        'messages': []
-    }
+    # Create and save a new session entry
+    try:
+        session = engine.create_session(title, current_user())
+    except Exception as e:
+        st.error(f"Error saving sessions: {str(e)}")
+        return None
+    session_id = session['id']
+    st.session_state.sessions = load_sessions()
     
     # Update current session ID
     st.session_state.current_session_id = session_id
     
     # Clear chat history for the new session
     st.session_state.chat_history = []
-    
-    # Save sessions
-    save_sessions()
+    st.session_state.history_window = HISTORY_WINDOW
     
     # Show notification
-    set_notification(f"New session '{st.session_state.sessions[session_id]['title']}' created")
+    set_notification(f"New session '{session['title']}' created")
     
     return session_id
 
@@ -354,14 +397,15 @@ def load_session(session_id):
         st.session_state.current_session_id = session_id
         
         # Load chat history from the session
-        st.session_state.chat_history = st.session_state.sessions[session_id]['messages']
+        st.session_state.chat_history = load_session_messages(session_id)
+        st.session_state.history_window = HISTORY_WINDOW
         
         # Update the last accessed timestamp
-        st.session_state.sessions[session_id]['last_updated'] = datetime.now().isoformat()
-        save_sessions()
+        session = dict(st.session_state.sessions[session_id], last_updated=datetime.now().isoformat())
+        save_sessions(session)
         
         # Show notification
-        set_notification(f"Loaded session: {st.session_state.sessions[session_id]['title']}")
+        set_notification(f"Loaded session: {session['title']}")
         
         return True
     
@@ -372,11 +416,10 @@ def delete_session(session_id):
     if session_id in st.session_state.sessions:
         session_title = st.session_state.sessions[session_id]['title']
         
-        # Remove the session
-        del st.session_state.sessions[session_id]
-        
-        # Save sessions
-        save_sessions()
+        # Remove the session; the index is only re-read once the store has
+        # deleted it
+        if not delete_stored_session(session_id):
+            return False
         
         # If the current session was deleted, create a new session
         if st.session_state.current_session_id == session_id:
@@ -395,10 +438,7 @@ def rename_session(session_id, new_title):
         old_title = st.session_state.sessions[session_id]['title']
         
         # Update the title
-        st.session_state.sessions[session_id]['title'] = new_title
-        
-        # Save sessions
-        save_sessions()
+        rename_stored_session(session_id, new_title)
         
         # Show notification
         set_notification(f"Session renamed from '{old_title}' to '{new_title}'")
@@ -415,7 +455,7 @@ def set_notification(message):
     }
 
 # Function to handle message submission
-def handle_submit(user_input):
+def handle_submit(user_input, use_cache=True):
     if user_input.strip():
         # Check if the input is a session management command
         if handle_session_command(user_input):
@@ -428,74 +468,59 @@ def handle_submit(user_input):
             session_id = create_new_session()
         
         # Add user message to chat history
-        message_id = str(uuid.uuid4())
-        timestamp = datetime.now().strftime("%I:%M %p · %d %b %Y")
+        user_message = engine.new_message('user', user_input)
+        created = user_message.created
+        st.session_state.chat_history.append(user_message)
         
-        st.session_state.chat_history.append({
-            'id': message_id,
-            'role': 'user',
-            'content': user_input,
-            'timestamp': timestamp
-        })
-        
-        # Auto-generate title for new sessions with no messages
+        # Auto-generate title for new sessions with no messages; this runs in
+        # the background so it doesn't delay the code response, and the
+        # timestamped default title is kept until it finishes
         if (st.session_state.current_session_id and 
-            len(st.session_state.sessions[st.session_state.current_session_id]['messages']) == 0 and
+            len(st.session_state.chat_history) == 1 and
             st.session_state.sessions[st.session_state.current_session_id]['title'].startswith("New Session")):
-            new_title = generate_session_title(user_input)
-            rename_session(st.session_state.current_session_id, new_title)
+            st.session_state.pending_title = {
+                'session_id': st.session_state.current_session_id,
+                'future': background.submit(engine.generate_session_title, user_input)
+            }
+        
+        # Prior turns of this session, without the message just added
+        history = st.session_state.chat_history[:-1]
         
-        # Check if the prompt is requesting code or not
-        if is_code_request(user_input):
+        # Check if the prompt is requesting code or not; follow-ups such as
+        # "now add error handling" count when the session already has code
+        if engine.wants_code(user_input, history):
             # Generate AI response for code
             try:
-                with st.spinner("Generating code..."):
-                    ai_response = generate_code(user_input)
+                context_text = build_request_context(history)
+                if STREAM_RESPONSES:
+                    ai_response = stream_code_response(user_input, use_cache=use_cache, context_text=context_text)
+                else:
+                    with st.spinner("Generating code..."):
+                        ai_response = generate_code(user_input, use_cache=use_cache, context_text=context_text)
                 
                 # Add AI response to chat history
-                ai_message_id = str(uuid.uuid4())
-                st.session_state.chat_history.append({
-                    'id': ai_message_id,
-                    'role': 'assistant',
-                    'content': ai_response,
-                    'timestamp': timestamp
-                })
+                st.session_state.chat_history.append(engine.new_message('assistant', ai_response, created))
             except Exception as e:
                 error_message = str(e)
                 st.error(f"Error: {error_message}")
                 
                 # Add error message to chat history
-                error_message_id = str(uuid.uuid4())
-                st.session_state.chat_history.append({
-                    'id': error_message_id,
-                    'role': 'assistant',
-                    'content': f"Error generating code: {error_message}",
-                    'timestamp': timestamp
-                })
+                st.session_state.chat_history.append(
+                    engine.new_message('assistant', f"Error generating code: {error_message}", created)
+                )
         else:
             # Handle non-code requests with a helpful message
-            non_code_response = """
-I'm CodeCraft AI, designed specifically to help you generate code. I can't provide explanations about concepts, theories, or general information.
-
-Please rephrase your request to ask for specific code implementation, such as:
-- "Create a Python function to..."
-- "Write JavaScript code that..."
-- "Build an HTML form with..."
-
-For general information, you might want to use a different AI assistant or search engine.
-"""
-            # Add non-code response to chat history
-            non_code_message_id = str(uuid.uuid4())
-            st.session_state.chat_history.append({
-                'id': non_code_message_id,
-                'role': 'assistant',
-                'content': non_code_response,
-                'timestamp': timestamp
-            })
+            st.session_state.chat_history.append(engine.new_message('assistant', engine.NON_CODE_RESPONSE, created))
         
         # Save current session
         save_current_session()
         
+        # Apply the generated title if it is ready
+        apply_pending_title()
+        
+        # Summarize turns that will no longer fit in the next request's context
+        schedule_summary_update()
+        
         # Reset the input field by using a new key
         reset_input()
         
@@ -549,8 +574,7 @@ def handle_session_command(user_input):
     # Command to clear chat history in current session
     if re.match(r'^clear (this|current|the) (session|chat|history)$', input_lower):
         if st.session_state.current_session_id:
-            st.session_state.chat_history = []
-            save_current_session()
+            remove_messages([msg['id'] for msg in st.session_state.chat_history])
             set_notification("Chat history cleared for the current session")
             return True
         else:
@@ -559,77 +583,67 @@ def handle_session_command(user_input):
     
     return False
 
-# Function to generate code
-def generate_code(prompt):
-    try:
-        # Enhance the prompt to ensure only code is generated
-        enhanced_prompt = f"""
-        You are CodeCraft AI, an elite-level programmer that ONLY generates code, never explanations or theory.
-        
-        Generate clean, optimized, and working code for the following request:
-        
-        {prompt}
-
-       Act like an elite-level software engineer and prompt engineering expert. You have been writing optimized, scalable, and clean code in multiple languages for over 20 years. You are deeply familiar with performance tuning, code modularity, algorithm efficiency, and best practices in documentation. You also specialize in using AI systems like GPT-4 to generate accurate and production-level code.
-
-        Your task is to generate high-quality, working code in response to a user’s request. To ensure maximum quality, follow these steps:
+# Function to get the user whose session shard this browser session uses
+def current_user():
+    return st.session_state.user_key
 
-        Step 1: Break down the problem into logical components. Explain what the user is asking for in your own words and what the output should accomplish.
-        Step 2: Propose an architectural or algorithmic approach. Highlight any important trade-offs, edge cases, or assumptions.
-        Step 3: Write clean, optimized, and well-documented code to implement the solution.
+# Function to get the prompt template selected for this session
+def current_template():
+    return prompts.get_template(st.session_state.get('prompt_template'))
 
-        Use detailed comments to explain what each part does
-
-        Take a deep breath and work on this problem step-by-step.
-        """
-        
-        # Set proper generation parameters
-        generation_config = {
-            "temperature": 0.7,
-            "top_p": 0.95,
-            "top_k": 64,
-            "max_output_tokens": 8192,
-        }
-        
-        # Use the safety settings appropriate for code generation
-        safety_settings = [
-            {
-                "category": "HARM_CATEGORY_HARASSMENT",
-                "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-            },
-            {
-                "category": "HARM_CATEGORY_HATE_SPEECH",
-                "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-            },
-            {
-                "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-            },
-            {
-                "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-            }
-        ]
-        
-        response = model.generate_content(
-            enhanced_prompt,
-            generation_config=generation_config,
-            safety_settings=safety_settings
-        )
-        
-        return response.text
+# Function to generate code, reporting errors as the response text
+def generate_code(prompt, use_cache=True, context_text=""):
+    try:
+        return engine.generate_code(prompt, use_cache=use_cache, context_text=context_text, template=current_template())
     except Exception as e:
         return f"Error generating code: {str(e)}"
 
+# Function to stream a code response into a placeholder as it is generated;
+# the engine serves cached responses and joins identical requests in flight
+def stream_code_response(prompt, use_cache=True, context_text=""):
+    placeholder = st.empty()
+    parser = StreamingCodeBlockParser()
+    chunks = []
+    
+    try:
+        for text in engine.generate_code_stream(prompt, context_text, current_template(), use_cache=use_cache):
+            chunks.append(text)
+            
+            # Re-render the partial response; an open fence renders as code
+            segments = parser.feed(text)
+            with placeholder.container():
+                render_content_blocks(segments)
+    except Exception as e:
+        # Keep what was streamed before the error
+        chunks.append(f"\n\nError generating code: {str(e)}")
+    
+    placeholder.empty()
+    
+    return "".join(chunks)
+
 # Function to list available models
 def list_available_models():
     try:
-        models = genai.list_models()
-        model_names = [model.name for model in models]
-        return model_names
+        return engine.list_available_models()
     except Exception as e:
         return f"Error listing models: {str(e)}"
 
+# Function to list ranked search results in the sidebar; clicking one opens
+# its session
+def show_search_results(query):
+    results = [result for result in search_sessions(query) if result['session_id'] in st.session_state.sessions]
+    if not results:
+        st.sidebar.caption("No matches")
+        return
+    for i, result in enumerate(results):
+        if st.sidebar.button(result['title'], key=f"search_result_{i}"):
+            load_session(result['session_id'])
+            st.rerun()
+        if result['message_id'] is not None:
+            speaker = "You" if result['role'] == 'user' else "CodeCraft AI"
+            st.sidebar.caption(f"{speaker}: {' '.join(result['snippet'].split())}")
+    st.sidebar.divider()
+
 def show_sessions_sidebar():
     st.sidebar.title("Your Sessions")
     
@@ -638,16 +652,18 @@ def show_sessions_sidebar():
         create_new_session()
         st.rerun()
     
-    # Get sessions sorted by last updated
-    sessions_list = list(st.session_state.sessions.values())
-    sessions_list.sort(key=lambda x: x['last_updated'], reverse=True)
+    # Search titles, messages and code languages across all sessions
+    query = st.sidebar.text_input("🔍 Search sessions", key="session_search", placeholder="e.g. quicksort python")
+    if query.strip():
+        show_search_results(query)
+    
+    # Get the most recently updated sessions, one page at a time
+    sessions_list, total = recent_sessions(st.session_state.sidebar_limit)
     
     # Display sessions
     if sessions_list:
         for session in sessions_list:
-            # Format last updated date
-            last_updated = datetime.fromisoformat(session['last_updated'])
-            date_str = last_updated.strftime("%b %d, %Y")
+            date_str = session['date']
             
             # Create a container for the session item
             session_container = st.sidebar.container()
@@ -681,25 +697,37 @@ def show_sessions_sidebar():
                     if st.button("🗑️", key=f"delete_{session['id']}", help="Delete session"):
                         delete_session(session['id'])
                         st.rerun()
+        
+        # Reveal the next page of older sessions
+        if total > len(sessions_list):
+            if st.sidebar.button(f"Show more ({total - len(sessions_list)} older)", key="show_more_sessions"):
+                st.session_state.sidebar_limit += SIDEBAR_PAGE_SIZE
+                st.rerun()
     else:
         st.sidebar.info("No sessions yet. Start chatting to create your first session!")
 
 def main():
-    # Load sessions from file when the app starts
-    if not st.session_state.sessions:
-        st.session_state.sessions = load_sessions()
+    # Refresh the session index on every run; it is shared by all tabs in
+    # this process and only re-read when the store changes
+    st.session_state.sessions = load_sessions()
+    
+    # Drop the current session if it was deleted from another tab
+    if st.session_state.current_session_id not in st.session_state.sessions:
+        st.session_state.current_session_id = None
         
-        # If there are sessions but no current session, set the most recent one
-        if st.session_state.sessions and not st.session_state.current_session_id:
-            sessions_list = list(st.session_state.sessions.values())
-            sessions_list.sort(key=lambda x: x['last_updated'], reverse=True)
-            st.session_state.current_session_id = sessions_list[0]['id']
-            st.session_state.chat_history = st.session_state.sessions[st.session_state.current_session_id]['messages']
+    # If there are sessions but no current session, set the most recent one
+    if st.session_state.sessions and not st.session_state.current_session_id:
+        most_recent, _ = recent_sessions(1)
+        st.session_state.current_session_id = most_recent[0]['id']
+        st.session_state.chat_history = load_session_messages(st.session_state.current_session_id)
     
     # If no sessions exist, create a default one
     if not st.session_state.sessions:
         create_new_session("Welcome Session")
     
+    # Pick up a session title that finished generating after the last run
+    apply_pending_title()
+    
     # App title
     st.markdown("<h1 style='text-align: center; color: #e0e1dd;'>CodeCraft AI</h1>", unsafe_allow_html=True)
     st.markdown("<p style='text-align: center; color: #778da9;'>Ask me to generate code in any programming language</p>", unsafe_allow_html=True)
@@ -726,42 +754,7 @@ def main():
             st.session_state.notification = None
 
     # Display chat history
-    for idx, message in enumerate(st.session_state.chat_history):
-        with st.container():
-            if message['role'] == 'user':
-                st.markdown(f"""
-                <div class='chat-container'>
-                    <div class='header'>
-                        <strong>You</strong>
-                    </div>
-                    <div class='user-message'>
-                        {message['content']}
-                        <div class='timestamp'>{message['timestamp']}</div>
-                    </div>
-                </div>
-                """, unsafe_allow_html=True)
-            else:
-                st.markdown(f"""
-                <div class='chat-container'>
-                    <div class='header'>
-                        <strong>CodeCraft AI</strong>
-                    </div>
-                    <div class='assistant-message'>
-                """, unsafe_allow_html=True)
-                
-                # Process and display content with code blocks
-                content_blocks = extract_code_blocks(message['content'])
-                for language, block in content_blocks:
-                    if language:  # This is a code block
-                        st.code(block, language=language)
-                    else:  # This is regular text
-                        st.markdown(block)
-                
-                st.markdown(f"""
-                        <div class='timestamp'>{message['timestamp']}</div>
-                    </div>
-                </div>
-                """, unsafe_allow_html=True)
+    show_chat_history()
 
     # User input form
     with st.form(key="message_form", clear_on_submit=True):
@@ -772,27 +765,36 @@ def main():
             st.write("")
             st.write("")
             submit_button = st.form_submit_button("Send")
+            skip_cache = st.checkbox("Skip cache", help="Generate a fresh response instead of reusing a cached one")
         
         if submit_button and user_input.strip():
             # Process outside the form to prevent immediate rerun issues
             st.session_state.current_input = user_input
+            st.session_state.current_skip_cache = skip_cache
 
     # Process the submitted input (if any)
     if 'current_input' in st.session_state and st.session_state.current_input:
         user_input = st.session_state.current_input
         st.session_state.current_input = None  # Clear it to prevent reprocessing
-        handle_submit(user_input)
+        handle_submit(user_input, use_cache=not st.session_state.get('current_skip_cache', False))
 
     # Add a clear button to delete all chat history for current session
     if st.button("Clear Current Chat History"):
         if st.session_state.current_session_id:
-            st.session_state.chat_history = []
-            save_current_session()
+            remove_messages([msg['id'] for msg in st.session_state.chat_history])
             st.rerun()
 
     # Display sessions in sidebar
     show_sessions_sidebar()
 
+    # Let the user pick how detailed responses should be
+    st.sidebar.selectbox(
+        "Response style",
+        list(prompts.TEMPLATES),
+        key="prompt_template",
+        help="'code-only-compact' returns just the code; 'explained' adds a step-by-step breakdown"
+    )
+    
     # Show example prompts in the sidebar
     st.sidebar.title("Example Prompts")
     st.sidebar.markdown("""
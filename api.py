@@ -0,0 +1,197 @@
+import asyncio
+import json
+import re
+
+from dotenv import load_dotenv
+
+# Load environment variables before the engine reads its settings
+load_dotenv()
+
+import engine
+import metrics
+
+# Minimal ASGI app over the engine, with no web framework dependency.
+# Run it with any ASGI server, e.g. `uvicorn api:app`.
+#
+#   GET    /health                      liveness check
+#   GET    /metrics                     metrics in the Prometheus text format
+#   POST   /generate                    {"prompt", "template"?, "use_cache"?, "history"?}
+#   GET    /sessions                    session index
+#   POST   /sessions                    {"title"?} creates a session
+#   GET    /sessions/<id>               a session and its messages
+#   PATCH  /sessions/<id>               {"title"} renames a session
+#   DELETE /sessions/<id>               deletes a session
+#   POST   /sessions/<id>/messages      {"prompt", "template"?, "use_cache"?}
+#
+# Session endpoints work on the sessions of the user named in the
+# X-CodeCraft-User header (the default user if it is missing). Put the
+# service behind something that authenticates users and sets the header.
+
+# Largest request body accepted, in bytes
+MAX_BODY_BYTES = 1024 * 1024
+
+_SESSION_RE = re.compile(r"^/sessions/([^/]+)$")
+_MESSAGES_RE = re.compile(r"^/sessions/([^/]+)/messages$")
+
+USER_HEADER = b"x-codecraft-user"
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# Function to run a blocking engine call without blocking the event loop
+async def run_blocking(fn, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(None, lambda: fn(*args, **kwargs))
+
+
+async def read_json(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if len(body) > MAX_BODY_BYTES:
+            raise HTTPError(413, "Request body too large")
+        if not message.get("more_body"):
+            break
+    if not body:
+        return {}
+    try:
+        data = json.loads(body)
+    except ValueError:
+        raise HTTPError(400, "Request body must be JSON")
+    if not isinstance(data, dict):
+        raise HTTPError(400, "Request body must be a JSON object")
+    return data
+
+
+def require_prompt(data):
+    prompt = data.get("prompt")
+    if not isinstance(prompt, str) or not prompt.strip():
+        raise HTTPError(400, "'prompt' is required")
+    return prompt
+
+
+# Function to read the optional prior turns of a /generate request as
+# messages; each must be {"role": "user" | "assistant", "content": "..."}
+def read_history(data):
+    history = data.get("history") or []
+    if not isinstance(history, list):
+        raise HTTPError(400, "'history' must be a list of messages")
+    messages = []
+    for item in history:
+        if not isinstance(item, dict) or item.get("role") not in ("user", "assistant") or \
+                not isinstance(item.get("content"), str):
+            raise HTTPError(400, "Each 'history' item needs a 'role' of user or assistant and a string 'content'")
+        messages.append(engine.new_message(item["role"], item["content"]))
+    return messages
+
+
+async def send_response(send, status, body, content_type="application/json"):
+    if content_type == "application/json":
+        body = json.dumps(body)
+    body = body.encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", content_type.encode()), (b"content-length", str(len(body)).encode())]
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def generate(data):
+    prompt = require_prompt(data)
+    history = read_history(data)
+    text = await run_blocking(
+        engine.respond, prompt, history,
+        use_cache=data.get("use_cache", True), template=engine.get_template(data.get("template"))
+    )
+    return {
+        'response': text,
+        'is_code': text != engine.NON_CODE_RESPONSE,
+        'code_blocks': [{'language': language, 'code': code} for language, code in engine.code_blocks(text)]
+    }
+
+
+# Function to get the user a request acts for
+def request_user(scope):
+    for name, value in scope.get("headers", []):
+        if name.lower() == USER_HEADER and value.strip():
+            return value.decode("utf-8").strip()
+    return engine.DEFAULT_USER
+
+
+async def route(method, path, receive, user):
+    if path == "/health" and method == "GET":
+        return 200, {'status': 'ok'}
+    if path == "/generate" and method == "POST":
+        return 200, await generate(await read_json(receive))
+    if path == "/sessions":
+        if method == "GET":
+            return 200, list((await run_blocking(engine.load_sessions, user)).values())
+        if method == "POST":
+            data = await read_json(receive)
+            return 201, await run_blocking(engine.create_session, data.get("title"), user)
+
+    match = _SESSION_RE.match(path)
+    if match:
+        session_id = match.group(1)
+        session = (await run_blocking(engine.load_sessions, user)).get(session_id)
+        if session is None:
+            raise HTTPError(404, "Session not found")
+        if method == "GET":
+            messages = await run_blocking(engine.load_session_messages, session_id, user)
+            return 200, dict(session, messages=[message.to_dict() for message in messages])
+        if method == "PATCH":
+            title = (await read_json(receive)).get("title")
+            if not isinstance(title, str) or not title.strip():
+                raise HTTPError(400, "'title' is required")
+            return 200, await run_blocking(engine.rename_session, session_id, title.strip(), user)
+        if method == "DELETE":
+            await run_blocking(engine.delete_session, session_id, user)
+            return 200, {'deleted': session_id}
+
+    match = _MESSAGES_RE.match(path)
+    if match and method == "POST":
+        data = await read_json(receive)
+        try:
+            message = await run_blocking(
+                engine.chat, match.group(1), require_prompt(data),
+                use_cache=data.get("use_cache", True), template=engine.get_template(data.get("template")),
+                user=user
+            )
+        except KeyError:
+            raise HTTPError(404, "Session not found")
+        return 200, message.to_dict()
+
+    raise HTTPError(404, "Not found")
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] != "http":
+        return
+
+    method = scope["method"]
+    path = scope["path"].rstrip("/") or "/"
+    if path == "/metrics" and method == "GET":
+        await send_response(send, 200, metrics.export_prometheus(), "text/plain; version=0.0.4")
+        return
+
+    try:
+        with metrics.timed("api.seconds", method=method):
+            status, body = await route(method, path, receive, request_user(scope))
+    except HTTPError as e:
+        status, body = e.status, {'error': str(e)}
+    except Exception as e:
+        status, body = 500, {'error': str(e)}
+    await send_response(send, status, body)
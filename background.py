@@ -0,0 +1,12 @@
+from concurrent.futures import ThreadPoolExecutor
+
+# Worker threads shared by every session in the server process, used for
+# model calls that should not block the script run (e.g. session titles)
+MAX_WORKERS = 4
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="codecraft-bg")
+
+
+# Function to run a callable in the background and return its future
+def submit(fn, *args, **kwargs):
+    return _executor.submit(fn, *args, **kwargs)
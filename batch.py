@@ -0,0 +1,168 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import engine
+import gemini_client
+
+# Prompts generated at once by default
+DEFAULT_CONCURRENCY = 4
+
+# Attempts per prompt when the rate limit is hit
+MAX_ATTEMPTS = 4
+
+# Pause for every worker after a rate-limit error, doubled on each repeat
+RATE_LIMIT_PAUSE = 10.0
+MAX_RATE_LIMIT_PAUSE = 120.0
+
+
+# Spaces out request starts to at most `per_minute` a minute, and pauses
+# every worker after the API reports that the rate limit was hit
+class RateLimiter:
+    def __init__(self, per_minute=None):
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self.pauses = 0
+        self._next_start = 0.0
+        self._paused_until = 0.0
+        self._pause = RATE_LIMIT_PAUSE
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start, self._paused_until)
+            self._next_start = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+    def rate_limited(self):
+        with self._lock:
+            self.pauses += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + self._pause)
+            self._pause = min(self._pause * 2, MAX_RATE_LIMIT_PAUSE)
+
+    def succeeded(self):
+        with self._lock:
+            self._pause = RATE_LIMIT_PAUSE
+
+
+# Function to read prompts from a JSONL file. Each line is an object with a
+# "prompt" and optional "id" and "template", or a bare JSON string; ids
+# default to the line number.
+def read_prompts(path):
+    items = []
+    with open(path) as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                item = {'prompt': item}
+            items.append({
+                'id': str(item.get('id', line_number)),
+                'prompt': item['prompt'],
+                'template': item.get('template')
+            })
+    return items
+
+
+# Function to get the ids already answered in an output file, so an
+# interrupted run can be resumed; failed prompts are tried again
+def completed_ids(path):
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                # A line cut short by an interruption
+                continue
+            if 'error' not in result:
+                done.add(result['id'])
+    return done
+
+
+def _ends_with_newline(path):
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+# Function to answer a single prompt, retrying after rate-limit errors
+def run_prompt(item, limiter, use_cache=True):
+    start = time.perf_counter()
+    result = {'id': item['id'], 'prompt': item['prompt'], 'is_code': engine.is_code_request(item['prompt'])}
+    if not result['is_code']:
+        result['seconds'] = 0.0
+        return result
+
+    template = engine.get_template(item['template'])
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        limiter.acquire()
+        try:
+            result['response'] = engine.generate_code(item['prompt'], use_cache=use_cache, template=template)
+        except Exception as e:
+            if gemini_client.is_rate_limited(e) and attempt < MAX_ATTEMPTS:
+                limiter.rate_limited()
+                continue
+            result['error'] = str(e)
+        else:
+            limiter.succeeded()
+        break
+    result['seconds'] = round(time.perf_counter() - start, 3)
+    return result
+
+
+# Function to run a JSONL file of prompts and append results to a JSONL
+# output file as they complete. Prompts already answered in the output are
+# skipped. Returns a report with counts and prompts per minute.
+def run_batch(input_path, output_path, concurrency=DEFAULT_CONCURRENCY, per_minute=None,
+              use_cache=True, on_result=None):
+    items = read_prompts(input_path)
+    done = completed_ids(output_path)
+    pending = [item for item in items if item['id'] not in done]
+    limiter = RateLimiter(per_minute)
+    report = {'total': len(items), 'resumed': len(items) - len(pending), 'completed': 0,
+              'non_code': 0, 'failed': 0}
+
+    start = time.perf_counter()
+    with open(output_path, "a") as out, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        # Start on a fresh line if an interrupted run left a partial one
+        if out.tell() and not _ends_with_newline(output_path):
+            out.write("\n")
+        queue = iter(pending)
+        running = set()
+        while True:
+            # Keep at most `concurrency` prompts in flight
+            while len(running) < concurrency:
+                item = next(queue, None)
+                if item is None:
+                    break
+                running.add(executor.submit(run_prompt, item, limiter, use_cache))
+            if not running:
+                break
+            finished, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                result = future.result()
+                out.write(json.dumps(result) + "\n")
+                out.flush()
+                if 'error' in result:
+                    report['failed'] += 1
+                elif not result['is_code']:
+                    report['non_code'] += 1
+                else:
+                    report['completed'] += 1
+                if on_result:
+                    on_result(result)
+
+    elapsed = time.perf_counter() - start
+    processed = report['completed'] + report['non_code'] + report['failed']
+    report['seconds'] = round(elapsed, 3)
+    report['rate_limit_pauses'] = limiter.pauses
+    report['prompts_per_minute'] = round(processed * 60 / elapsed, 1) if elapsed > 0 else 0.0
+    return report
@@ -0,0 +1,62 @@
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from classifier import CODE_KEYWORDS, NON_CODE_PATTERNS, is_code_request
+
+PROMPTS = 100000
+
+TEMPLATES = (
+    "Create a Python function to find prime numbers",
+    "Write HTML and CSS for a responsive navigation bar",
+    "Generate a JavaScript function that calculates Fibonacci sequence",
+    "Build a Flask API with a POST endpoint to accept JSON data",
+    "Create a React component for a form with validation",
+    "What is the difference between a list and a tuple?",
+    "Explain about the history of the internet",
+    "I feel good today, any tips for staying happy?",
+    "Tell me about the pros and cons of microservices",
+    "Implement a binary search tree in Rust with insert and delete"
+)
+
+
+# The previous implementation, kept here as the baseline
+def legacy_is_code_request(prompt):
+    has_code_keywords = any(keyword.lower() in prompt.lower() for keyword in CODE_KEYWORDS)
+    is_non_code_request = any(re.search(pattern, prompt.lower()) for pattern in NON_CODE_PATTERNS)
+    return has_code_keywords and not is_non_code_request
+
+
+# Function to build a corpus of prompts of varying length
+def make_corpus():
+    rng = random.Random(0)
+    words = " ".join(TEMPLATES).split()
+    corpus = []
+    for _ in range(PROMPTS):
+        prompt = rng.choice(TEMPLATES)
+        if rng.random() < 0.5:
+            prompt += " " + " ".join(rng.choices(words, k=rng.randint(5, 60)))
+        corpus.append(prompt)
+    return corpus
+
+
+def bench(name, fn, corpus):
+    start = time.perf_counter()
+    code = sum(1 for prompt in corpus if fn(prompt))
+    elapsed = time.perf_counter() - start
+    print(f"{name:8} prompts={len(corpus)} total={elapsed:.3f}s "
+          f"per_prompt={elapsed / len(corpus) * 1e6:.2f}us code_requests={code}")
+
+
+def main():
+    corpus = make_corpus()
+    bench("legacy", legacy_is_code_request, corpus)
+    bench("compiled", is_code_request, corpus)
+
+
+if __name__ == "__main__":
+    main()
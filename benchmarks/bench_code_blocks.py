@@ -0,0 +1,85 @@
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from code_blocks import StreamingCodeBlockParser, extract_code_blocks
+
+RUNS = 200
+
+# Roughly 8k tokens (~32KB) of prose interleaved with many code blocks
+BLOCK = """Here is the next part of the implementation, with the helper explained below.
+
+```python
+def helper(values):
+    result = []
+    for value in values:
+        if value % 2 == 0:
+            result.append(value * 2)
+    return result
+```
+
+"""
+RESPONSE = BLOCK * (32000 // len(BLOCK))
+
+# Chunk size similar to what the streaming API delivers
+CHUNK = 64
+
+
+# The previous implementation, kept here as the baseline
+def legacy_extract_code_blocks(text):
+    pattern = r"```([\w\+\#]*)?\n([\s\S]*?)\n```"
+    matches = re.findall(pattern, text)
+    if not matches:
+        return [("", text)]
+    result = []
+    last_end = 0
+    for match in re.finditer(pattern, text):
+        if match.start() > last_end:
+            result.append(("", text[last_end:match.start()]))
+        language = match.group(1).strip() if match.group(1) else ""
+        result.append((language, match.group(2)))
+        last_end = match.end()
+    if last_end < len(text):
+        result.append(("", text[last_end:]))
+    return result
+
+
+def bench(name, fn):
+    start = time.perf_counter()
+    for _ in range(RUNS):
+        segments = fn(RESPONSE)
+    elapsed = (time.perf_counter() - start) / RUNS
+    print(f"{name:22} chars={len(RESPONSE)} segments={len(segments)} per_response={elapsed * 1000:.3f}ms")
+
+
+# Re-parsing the whole accumulated text after every chunk (what the
+# streaming UI would do without the incremental parser)
+def reparse_per_chunk(text):
+    segments = None
+    for end in range(CHUNK, len(text) + CHUNK, CHUNK):
+        segments = extract_code_blocks(text[:end])
+    return segments
+
+
+def incremental(text):
+    parser = StreamingCodeBlockParser()
+    segments = None
+    for start in range(0, len(text), CHUNK):
+        segments = parser.feed(text[start:start + CHUNK])
+    return segments
+
+
+def main():
+    global RUNS
+    bench("legacy", legacy_extract_code_blocks)
+    bench("single-pass", extract_code_blocks)
+    RUNS = 5
+    bench("stream: reparse/chunk", reparse_per_chunk)
+    bench("stream: incremental", incremental)
+
+
+if __name__ == "__main__":
+    main()
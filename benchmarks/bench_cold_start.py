@@ -0,0 +1,133 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARKS)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCHMARKS)
+
+from loadtest import apptest_available, git_revision
+
+# Cold start results are appended here, tagged with the commit they ran on
+RESULTS_FILE = os.path.join(BENCHMARKS, "results", "cold_start.jsonl")
+
+RUNS = 5
+RERUNS = 20
+
+# Run in a fresh interpreter: import the engine as the app does on its first
+# run, then make the first (fake) generation, and report what was imported
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import engine
+engine.check_configuration()
+imported = time.perf_counter()
+engine.generate_code("Create a Python function to find prime numbers", use_cache=False)
+generated = time.perf_counter()
+print(json.dumps({'import_s': imported - start, 'first_generation_s': generated - imported,
+                  'sdk_imported_at_start': 'google.generativeai' in sys.modules}))
+"""
+
+
+# Function to time a fresh interpreter importing a module, or None if it
+# isn't installed
+def import_seconds(module):
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True)
+    return float(result.stdout) if result.returncode == 0 else None
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+# Function to measure the engine's cold start over several fresh processes
+def engine_cold_start():
+    env = dict(os.environ, CODECRAFT_FAKE_MODEL="1", CODECRAFT_FAKE_LATENCY="0",
+               PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    runs = []
+    for _ in range(RUNS):
+        # A fresh working directory, so no cache or session files carry over
+        with tempfile.TemporaryDirectory() as workdir:
+            wall = time.perf_counter()
+            result = subprocess.run([sys.executable, "-c", CHILD], cwd=workdir, env=env, capture_output=True,
+                                    text=True, check=True)
+            elapsed = time.perf_counter() - wall
+        run = json.loads(result.stdout)
+        run['process_s'] = elapsed
+        runs.append(run)
+    return {
+        'process_ms': round(median(run['process_s'] for run in runs) * 1000, 1),
+        'import_engine_ms': round(median(run['import_s'] for run in runs) * 1000, 1),
+        'first_generation_ms': round(median(run['first_generation_s'] for run in runs) * 1000, 1),
+        'sdk_imported_at_start': any(run['sdk_imported_at_start'] for run in runs)
+    }
+
+
+# Function to time the Streamlit script's first run (first paint) and its
+# reruns with AppTest, when the installed Streamlit has it
+def app_runs():
+    if not apptest_available():
+        return None
+    from streamlit.testing.v1 import AppTest
+    os.environ["CODECRAFT_FAKE_MODEL"] = "1"
+    # The app keeps its session files and response cache in the working
+    # directory, so run it in a temporary one
+    previous_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            app = AppTest.from_file(os.path.join(ROOT, "CodeSage.py"), default_timeout=60)
+            start = time.perf_counter()
+            app.run()
+            first = time.perf_counter() - start
+            reruns = []
+            for _ in range(RERUNS):
+                start = time.perf_counter()
+                app.run()
+                reruns.append(time.perf_counter() - start)
+        finally:
+            os.chdir(previous_cwd)
+    return {'first_run_ms': round(first * 1000, 1), 'rerun_ms': round(median(reruns) * 1000, 1)}
+
+
+def main():
+    commit, dirty = git_revision()
+    result = {
+        'commit': commit,
+        'dirty': dirty,
+        'time': datetime.now().isoformat(timespec="seconds"),
+        'engine': engine_cold_start(),
+        'app': app_runs(),
+        # What deferring the SDK import saves on start (None if not installed)
+        'sdk_import_ms': None
+    }
+    sdk_seconds = import_seconds("google.generativeai")
+    if sdk_seconds is not None:
+        result['sdk_import_ms'] = round(sdk_seconds * 1000, 1)
+
+    engine = result['engine']
+    print(f"commit {commit}{' (dirty)' if dirty else ''}")
+    print(f"engine: process {engine['process_ms']}ms, import {engine['import_engine_ms']}ms, "
+          f"first generation {engine['first_generation_ms']}ms, "
+          f"SDK imported at start: {engine['sdk_imported_at_start']}")
+    sdk_import = result['sdk_import_ms']
+    print(f"google.generativeai import: {'not installed' if sdk_import is None else f'{sdk_import}ms'}")
+    if result['app']:
+        print(f"app: first run {result['app']['first_run_ms']}ms, rerun {result['app']['rerun_ms']}ms")
+    else:
+        print("app: skipped (AppTest needs Streamlit 1.28 or newer)")
+
+    os.makedirs(os.path.dirname(RESULTS_FILE), exist_ok=True)
+    with open(RESULTS_FILE, "a") as f:
+        f.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_message import Message
+from session_store import JsonSessionStore, SqliteSessionStore
+
+PROCESSES = 8
+SESSIONS_PER_PROCESS = 25
+MESSAGES_PER_SESSION = 6
+
+
+def open_store(backend, path):
+    if backend == "json":
+        return JsonSessionStore(path)
+    return SqliteSessionStore(path)
+
+
+# Function run in each worker process: create sessions and append messages
+# one at a time, saving after each one as the app does. Returns the ids of
+# the sessions it created.
+def worker(backend, path, worker_id):
+    store = open_store(backend, path)
+    session_ids = []
+    for i in range(SESSIONS_PER_PROCESS):
+        timestamp = datetime.now().isoformat()
+        session = {
+            'id': str(uuid.uuid4()),
+            'title': f"Worker {worker_id} session {i}",
+            'created_at': timestamp,
+            'last_updated': timestamp
+        }
+        store.save_session_meta(session)
+        session_ids.append(session['id'])
+
+        messages = []
+        for j in range(MESSAGES_PER_SESSION):
+            messages.append(Message.create('user' if j % 2 == 0 else 'assistant', f"message {j} " * 20))
+            store.save_messages(session['id'], messages)
+            # Other tabs keep reading the index while writes happen
+            store.load_index()
+    store.close()
+    return session_ids
+
+
+# Function to hammer a store from several processes and check that every
+# session and message written is still there afterwards
+def bench(backend, path):
+    start = time.perf_counter()
+    with multiprocessing.Pool(PROCESSES) as pool:
+        results = pool.starmap(worker, [(backend, path, i) for i in range(PROCESSES)])
+    elapsed = time.perf_counter() - start
+
+    store = open_store(backend, path)
+    index = store.load_index()
+    written = [session_id for session_ids in results for session_id in session_ids]
+    lost_sessions = [session_id for session_id in written if session_id not in index]
+    lost_messages = sum(
+        MESSAGES_PER_SESSION - len(store.load_messages(session_id))
+        for session_id in written if session_id in index
+    )
+    store.close()
+
+    writes = len(written) * (1 + MESSAGES_PER_SESSION)
+    print(f"{backend:7} processes={PROCESSES} sessions={len(written)} writes={writes} "
+          f"time={elapsed:.2f}s writes/s={writes / elapsed:.0f} "
+          f"lost_sessions={len(lost_sessions)} lost_messages={lost_messages}")
+    return not lost_sessions and not lost_messages
+
+
+def main():
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        ok &= bench("json", os.path.join(tmp, "sessions.json"))
+        ok &= bench("sqlite", os.path.join(tmp, "sessions.db"))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import glob
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_message import Message
+from session_store import MIGRATIONS, SqliteSessionStore, split_statements
+
+SESSIONS = 300
+TURNS_PER_SESSION = 10
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROMPTS = [
+    "Write a Python function that {}",
+    "Can you refactor this so that it {}",
+    "Now add error handling and make it {}",
+    "Create a small module which {}",
+]
+TASKS = ["parses a JSONL file", "retries on rate limits", "caches results in SQLite", "streams a response",
+         "splits markdown into code blocks", "keeps an LRU of sessions", "exports Prometheus metrics"]
+
+
+# Function to build a corpus of chat turns shaped like real ones: short
+# prompts and long responses that are mostly code (taken from this repo's
+# own source files) with some prose around it
+def make_corpus(rng):
+    sources = []
+    for path in sorted(glob.glob(os.path.join(ROOT, "*.py"))):
+        with open(path) as f:
+            sources.append(f.read().splitlines())
+    turns = []
+    for _ in range(SESSIONS * TURNS_PER_SESSION):
+        lines = rng.choice(sources)
+        start = rng.randrange(max(1, len(lines) - 40))
+        code = "\n".join(lines[start:start + rng.randint(40, 250)])
+        prompt = rng.choice(PROMPTS).format(rng.choice(TASKS))
+        response = (f"Here's an implementation that {rng.choice(TASKS)}:\n\n```python\n{code}\n```\n\n"
+                    f"### Explanation\n\n1. The function {rng.choice(TASKS)}.\n2. Errors are reported to the caller.\n")
+        turns.append((prompt, response))
+    return turns
+
+
+# Function to build the messages of every session in the old dict form and
+# as Message objects, sharing the same content strings
+def make_messages(turns):
+    created = time.time()
+    as_dicts, as_messages = [], []
+    for i in range(SESSIONS):
+        dicts, messages = [], []
+        for prompt, response in turns[i * TURNS_PER_SESSION:(i + 1) * TURNS_PER_SESSION]:
+            for role, content in (('user', prompt), ('assistant', response)):
+                message_id = str(uuid.uuid4())
+                dicts.append({'id': message_id, 'role': role, 'content': content,
+                              'timestamp': datetime.fromtimestamp(created).strftime("%I:%M %p · %d %b %Y")})
+                messages.append(Message(message_id, role, content, created))
+        as_dicts.append(dicts)
+        as_messages.append(messages)
+    return as_dicts, as_messages
+
+
+# Function to measure memory allocated by build(), excluding the content
+# strings (allocated before tracing starts)
+def allocated(build):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    value = build()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return value, size
+
+
+# Function to get a database's size once its WAL is checkpointed
+def database_size(path):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+    return os.path.getsize(path)
+
+
+# Function to write the messages with the schema before compact rows
+# (plain text content, string roles and timestamps)
+def write_plain_database(path, as_dicts):
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    for migration in MIGRATIONS[:4]:
+        if callable(migration):
+            migration(conn)
+        else:
+            for statement in split_statements(migration):
+                conn.execute(statement)
+    conn.execute("BEGIN")
+    for i, dicts in enumerate(as_dicts):
+        session_id = str(uuid.uuid4())
+        conn.execute("INSERT INTO sessions (id, title, created_at, last_updated) VALUES (?, ?, '', '')",
+                     (session_id, f"Session {i}"))
+        conn.executemany(
+            "INSERT INTO messages (session_id, seq, id, role, content, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+            [(session_id, seq, m['id'], m['role'], m['content'], m['timestamp']) for seq, m in enumerate(dicts)])
+    conn.execute("COMMIT")
+    conn.close()
+    return database_size(path)
+
+
+# Function to write the messages through the store (compact, compressed rows)
+def write_compact_database(path, as_messages):
+    store = SqliteSessionStore(path)
+    for i, messages in enumerate(as_messages):
+        session = {'id': str(uuid.uuid4()), 'title': f"Session {i}", 'created_at': '', 'last_updated': ''}
+        store.save_session_meta(session)
+        store.save_messages(session['id'], messages)
+    bodies = store._conn.execute("SELECT SUM(LENGTH(body)) FROM messages").fetchone()[0]
+    store.close()
+    return database_size(path), bodies
+
+
+def main():
+    turns = make_corpus(random.Random(0))
+    as_dicts, as_messages = make_messages(turns)
+    count = sum(len(messages) for messages in as_messages)
+    text = sum(len(m['content'].encode("utf-8")) for dicts in as_dicts for m in dicts)
+
+    # Each model gets its own time value, as every message has one
+    _, dict_memory = allocated(lambda: [[{'id': m.id, 'role': m['role'], 'content': m.content,
+                                          'timestamp': datetime.fromtimestamp(m.created).strftime("%I:%M %p · %d %b %Y")}
+                                         for m in messages] for messages in as_messages])
+    _, message_memory = allocated(lambda: [[Message(m.id, m.role, m.content, m.created + 0.0) for m in messages]
+                                           for messages in as_messages])
+    print(f"corpus: {count} messages, {text / 1e6:.1f}MB of text")
+    print(f"in memory (per-message overhead, excluding text): dicts {dict_memory / count:.0f}B, "
+          f"Message {message_memory / count:.0f}B ({1 - message_memory / dict_memory:.0%} smaller)")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, "sessions.json")
+        with open(json_path, "w") as f:
+            json.dump(as_dicts, f)
+        plain = write_plain_database(os.path.join(tmp, "plain.db"), as_dicts)
+        compact, bodies = write_compact_database(os.path.join(tmp, "compact.db"), as_messages)
+        print(f"message bodies: {text / 1e6:.1f}MB plain, {bodies / 1e6:.1f}MB compressed "
+              f"({1 - bodies / text:.0%} smaller)")
+        print(f"on disk (with search index): json {os.path.getsize(json_path) / 1e6:.1f}MB, "
+              f"sqlite plain {plain / 1e6:.1f}MB, sqlite compact {compact / 1e6:.1f}MB "
+              f"({1 - compact / plain:.0%} smaller)")
+
+
+if __name__ == "__main__":
+    main()
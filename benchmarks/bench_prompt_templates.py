@@ -0,0 +1,48 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import prompts
+
+PROMPTS = (
+    "Create a Python function to find prime numbers",
+    "Write HTML and CSS for a responsive navigation bar",
+    "Build a Flask API with a POST endpoint to accept JSON data",
+)
+
+# Size of the instructions that used to be wrapped around every prompt
+LEGACY_WRAPPER_TOKENS = 319
+
+
+# Function to measure output tokens against the real API when GEMINI is set
+def measure_output(template, prompt):
+    import google.generativeai as genai
+    genai.configure(api_key=os.environ["GEMINI"])
+    model = genai.GenerativeModel('gemini-1.5-flash', system_instruction=template.system_instruction)
+    response = model.generate_content(
+        prompts.render_request(template, prompt),
+        generation_config=template.generation_config
+    )
+    usage = response.usage_metadata
+    return usage.prompt_token_count, usage.candidates_token_count
+
+
+def main():
+    live = bool(os.getenv("GEMINI"))
+    print(f"legacy wrapper: ~{LEGACY_WRAPPER_TOKENS} tokens sent with every request")
+    for template in prompts.TEMPLATES.values():
+        for prompt in PROMPTS:
+            measured = prompts.measure_template(template, prompt)
+            line = (f"{prompts.template_id(template):24} system={measured['system_tokens']:4} "
+                    f"per_request={measured['request_tokens']:4}")
+            if live:
+                input_tokens, output_tokens = measure_output(template, prompt)
+                line += f" api_input={input_tokens:5} api_output={output_tokens:5}"
+            print(f"{line}  {prompt[:40]}")
+    if not live:
+        print("(set GEMINI to also measure output tokens against the API)")
+
+
+if __name__ == "__main__":
+    main()
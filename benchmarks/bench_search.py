@@ -0,0 +1,62 @@
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_message import Message
+from session_store import SqliteSessionStore
+
+SESSIONS = 5000
+MESSAGES_PER_SESSION = 40
+QUERIES = ["quicksort", "python", "rust binary tree", "fastapi", "merge sort java", "tokio"]
+RUNS = 20
+
+WORDS = ("function list parse value request handler async error loop index sort merge tree graph cache "
+         "string number server client token stream buffer retry queue").split()
+LANGUAGES = ["python", "javascript", "rust", "go", "java", "sql", "bash"]
+
+
+# Function to make a prompt or response; one response in three has a code block
+def fake_message(rng, role):
+    text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 80)))
+    if role == 'assistant' and rng.random() < 0.33:
+        language = rng.choice(LANGUAGES)
+        text += f"\n```{language}\ndef {rng.choice(WORDS)}():\n    return {rng.choice(WORDS)}\n```\n"
+    return Message.create(role, text)
+
+
+def main():
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SqliteSessionStore(os.path.join(tmp, "sessions.db"))
+        start = time.perf_counter()
+        for i in range(SESSIONS):
+            session = {'id': str(uuid.uuid4()), 'title': f"{rng.choice(WORDS)} {rng.choice(LANGUAGES)} {i}",
+                       'created_at': '', 'last_updated': ''}
+            store.save_session_meta(session)
+            messages = [fake_message(rng, 'user' if j % 2 == 0 else 'assistant') for j in range(MESSAGES_PER_SESSION)]
+            # Sprinkle in the words the queries look for
+            if i % 50 == 0:
+                messages[-1] = Message.create('assistant', messages[-1].content +
+                                              "\nquicksort with tokio and fastapi, a rust binary tree, merge sort in java")
+            store.save_messages(session['id'], messages)
+        print(f"indexed {SESSIONS * MESSAGES_PER_SESSION} messages in {time.perf_counter() - start:.1f}s")
+
+        for query in QUERIES:
+            timings = []
+            for _ in range(RUNS):
+                start = time.perf_counter()
+                results = store.search(query)
+                timings.append(time.perf_counter() - start)
+            timings.sort()
+            print(f"{query!r:20} results={len(results):3} median={timings[len(timings) // 2] * 1000:.2f}ms "
+                  f"max={timings[-1] * 1000:.2f}ms")
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
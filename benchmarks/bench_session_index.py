@@ -0,0 +1,74 @@
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session_store import JsonSessionStore, SqliteSessionStore
+
+SESSIONS = 5000
+RERUNS = 200
+
+
+# Function to build sessions that each hold a couple of messages
+def make_sessions():
+    timestamp = datetime.now().isoformat()
+    sessions = {}
+    for i in range(SESSIONS):
+        session_id = str(uuid.uuid4())
+        sessions[session_id] = {
+            'id': session_id,
+            'title': f"Session {i}",
+            'created_at': timestamp,
+            'last_updated': timestamp,
+            'messages': [
+                {'id': str(uuid.uuid4()), 'role': 'user', 'content': "Create a Python function " * 20, 'timestamp': ''},
+                {'id': str(uuid.uuid4()), 'role': 'assistant', 'content': "```python\nprint(1)\n```\n" * 50, 'timestamp': ''}
+            ]
+        }
+    return sessions
+
+
+# Function to time repeated load_index() calls, as happens on every rerun
+def bench(name, store):
+    store.invalidate()
+    start = time.perf_counter()
+    store.load_index()
+    cold = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(RERUNS):
+        store.load_index()
+    warm = (time.perf_counter() - start) / RERUNS
+
+    # What every rerun paid before the index was shared
+    start = time.perf_counter()
+    for _ in range(10):
+        store.invalidate()
+        store.load_index()
+    reparse = (time.perf_counter() - start) / 10
+
+    print(f"{name:8} sessions={SESSIONS} cold={cold * 1000:.2f}ms "
+          f"reparse/rerun={reparse * 1000:.2f}ms cached/rerun={warm * 1000:.4f}ms "
+          f"parses={store.index_loads} hits={store.index_hits}")
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, "sessions.json")
+        with open(json_path, 'w') as f:
+            json.dump(make_sessions(), f)
+        bench("json", JsonSessionStore(json_path))
+
+        # Importing the JSON file is the same path used for legacy migration
+        sqlite_store = SqliteSessionStore(os.path.join(tmp, "sessions.db"), legacy_json_path=json_path)
+        bench("sqlite", sqlite_store)
+        sqlite_store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session_store import SqliteSessionStore
+
+SESSIONS = 10000
+PAGE = 25
+RERUNS = 200
+
+
+# Function reproducing the old sidebar: sort every session and format every
+# date on each rerun
+def full_sort(index):
+    sessions = sorted(index.values(), key=lambda x: x['last_updated'], reverse=True)
+    return [(session['id'], datetime.fromisoformat(session['last_updated']).strftime("%b %d, %Y"))
+            for session in sessions]
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SqliteSessionStore(os.path.join(tmp, "sessions.db"))
+        start = datetime(2024, 1, 1)
+        for i in range(SESSIONS):
+            timestamp = (start + timedelta(minutes=i * 7 % SESSIONS)).isoformat()
+            store.save_session_meta({'id': str(uuid.uuid4()), 'title': f"Session {i}",
+                                     'created_at': timestamp, 'last_updated': timestamp})
+        index = store.load_index()
+        ids = list(index)
+
+        # Each rerun saves one session (as chatting does) and lists the sidebar
+        timings = {}
+        for name in ("full sort", "recency index"):
+            begin = time.perf_counter()
+            for i in range(RERUNS):
+                session = dict(index[ids[i]], last_updated=(start + timedelta(days=30, seconds=i)).isoformat())
+                store.save_session_meta(session)
+                if name == "full sort":
+                    full_sort(store.load_index())[:PAGE]
+                else:
+                    store.recent_sessions(limit=PAGE)
+            timings[name] = (time.perf_counter() - begin) / RERUNS
+        store.close()
+
+    for name, seconds in timings.items():
+        print(f"{name:14} sessions={SESSIONS} per rerun (save + list) = {seconds * 1000:.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
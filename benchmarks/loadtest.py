@@ -0,0 +1,310 @@
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import metrics
+
+# Results of every run are appended here, tagged with the commit they ran
+# on, so a change can be compared with earlier runs of the same settings
+RESULTS_FILE = os.path.join(ROOT, "benchmarks", "results", "loadtest.jsonl")
+
+# Streamlit's AppTest (used by --mode apptest) needs Streamlit 1.28+
+APPTEST_MIN_VERSION = (1, 28)
+
+CODE_PROMPTS = (
+    "Create a Python function to find prime numbers",
+    "Write HTML and CSS for a responsive navigation bar",
+    "Generate a JavaScript function that calculates Fibonacci sequence",
+    "Build a Flask API with a POST endpoint to accept JSON data",
+    "Implement a binary search tree in Rust with insert and delete",
+    "Now add error handling to it",
+    "Write a SQL query that finds duplicate emails",
+)
+OTHER_PROMPTS = (
+    "What is the difference between a list and a tuple?",
+    "Tell me about the history of the internet",
+)
+
+# Parameters that must match for two runs to be compared
+CONFIG_KEYS = ('mode', 'users', 'turns', 'latency', 'tokens_per_second', 'error_rate', 'seed', 'backend')
+
+
+# Function to build a user's prompts; about one in five is not a code request
+def user_prompts(rng, turns):
+    return [rng.choice(OTHER_PROMPTS) if rng.random() < 0.2 else rng.choice(CODE_PROMPTS) for _ in range(turns)]
+
+
+# Function to summarize a phase: throughput and latency percentiles
+def phase_report(latencies, seconds, errors=0):
+    latencies = sorted(latencies)
+    return {
+        'ops': len(latencies),
+        'errors': errors,
+        'seconds': round(seconds, 3),
+        'per_second': round(len(latencies) / seconds, 1) if seconds > 0 else 0.0,
+        'p50_ms': round(metrics.percentile(latencies, 50) * 1000, 3) if latencies else None,
+        'p95_ms': round(metrics.percentile(latencies, 95) * 1000, 3) if latencies else None
+    }
+
+
+# Function to time fn over items on one thread
+def run_serial(fn, items):
+    latencies = []
+    start = time.perf_counter()
+    for item in items:
+        begin = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - begin)
+    return phase_report(latencies, time.perf_counter() - start)
+
+
+# Function to run one worker per simulated user at the same time, on threads
+# or in separate processes; each worker returns (latencies, errors)
+def run_users(worker, users, processes=False):
+    start = time.perf_counter()
+    if processes:
+        # Fresh interpreters, so nothing carries over from this process's
+        # threads and event loop
+        executor = ProcessPoolExecutor(max_workers=len(users), mp_context=multiprocessing.get_context("spawn"))
+    else:
+        executor = ThreadPoolExecutor(max_workers=len(users))
+    with executor:
+        results = list(executor.map(worker, users))
+    elapsed = time.perf_counter() - start
+    return phase_report([latency for latencies, _ in results for latency in latencies], elapsed,
+                        sum(errors for _, errors in results))
+
+
+# Function to exercise the session store the way the UI does on each turn:
+# save the session, list the sidebar, reload the messages and search
+def bench_sessions(engine, users, turns, response):
+    def worker(user):
+        latencies = []
+        session = engine.create_session(f"Load test {user}", user)
+        messages = []
+        for turn in range(turns):
+            messages = messages + [engine.new_message('user', CODE_PROMPTS[turn % len(CODE_PROMPTS)]),
+                                   engine.new_message('assistant', response)]
+            begin = time.perf_counter()
+            engine.save_session(dict(session, last_updated=datetime.now().isoformat()), messages, user)
+            engine.recent_sessions(user, 25)
+            engine.load_session_messages(session['id'], user)
+            engine.search_sessions("prime", user)
+            latencies.append(time.perf_counter() - begin)
+        return latencies, 0
+    return run_users(worker, users)
+
+
+# Function to submit prompts as the UI's handle_submit does (classify,
+# generate with the session's context, save, update the summary) through
+# the engine, one simulated user per thread
+def bench_submit_engine(engine, users, turns, seed):
+    def worker(user):
+        rng = random.Random(f"{seed}-{user}")
+        latencies = []
+        errors = 0
+        session = engine.create_session(f"Load test {user}", user)
+        for prompt in user_prompts(rng, turns):
+            begin = time.perf_counter()
+            message = engine.chat(session['id'], prompt, use_cache=False, user=user)
+            latencies.append(time.perf_counter() - begin)
+            errors += message['content'].startswith("Error generating code")
+        return latencies, errors
+    return run_users(worker, users)
+
+
+# Function to submit one simulated user's prompts through the Streamlit
+# script with AppTest, as a browser session that types a prompt and presses
+# Send
+def apptest_user(user, turns, seed, timeout):
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(f"{seed}-{user}")
+    latencies = []
+    errors = 0
+    app = AppTest.from_file(os.path.join(ROOT, "CodeSage.py"), default_timeout=timeout)
+    app.session_state["user_key"] = user
+    app.run()
+    for prompt in user_prompts(rng, turns):
+        begin = time.perf_counter()
+        app.text_area[0].input(prompt)
+        next(button for button in app.button if button.label == "Send").click()
+        app.run()
+        latencies.append(time.perf_counter() - begin)
+        errors += len(app.exception) + len(app.error)
+    return latencies, errors
+
+
+# Function to submit prompts through the Streamlit script itself. AppTest
+# can only run one app per process, so each simulated user gets its own.
+def bench_submit_apptest(users, turns, seed, timeout):
+    return run_users(partial(apptest_user, turns=turns, seed=seed, timeout=timeout), users, processes=True)
+
+
+# Function to check whether the installed Streamlit has AppTest
+def apptest_available():
+    try:
+        import streamlit
+    except ImportError:
+        return False
+    version = tuple(int(part) for part in streamlit.__version__.split(".")[:2])
+    return version >= APPTEST_MIN_VERSION
+
+
+# Function to get the commit the benchmark runs on, and whether the tree
+# has uncommitted changes
+def git_revision():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(status.strip())
+
+
+# Function to get the peak resident memory of this process in MB
+def max_rss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+# Function to find the latest stored run with the same settings
+def previous_result(config):
+    if not os.path.exists(RESULTS_FILE):
+        return None
+    previous = None
+    with open(RESULTS_FILE) as f:
+        for line in f:
+            result = json.loads(line)
+            if all(result['config'].get(key) == config[key] for key in CONFIG_KEYS):
+                previous = result
+    return previous
+
+
+# Function to print a run, with changes against an earlier one
+def print_report(result, previous=None):
+    print(f"commit {result['commit']}{' (dirty)' if result['dirty'] else ''}, "
+          f"peak RSS {result['max_rss_mb']}MB")
+    for name, phase in result['phases'].items():
+        line = (f"{name:14} ops={phase['ops']:6} errors={phase['errors']:3} {phase['per_second']:10.1f}/s "
+                f"p50={phase['p50_ms']}ms p95={phase['p95_ms']}ms")
+        before = previous['phases'].get(name) if previous else None
+        if before and before['p95_ms'] and before['per_second']:
+            line += (f"  (vs {previous['commit']}: throughput {phase['per_second'] / before['per_second'] - 1:+.0%}, "
+                     f"p95 {phase['p95_ms'] / before['p95_ms'] - 1:+.0%})")
+        print(line)
+
+
+# Function to run every phase; the engine is imported here, once the
+# working directory and its settings are in place
+def run_phases(args):
+    import engine
+    from classifier import is_code_request
+    from code_blocks import extract_code_blocks
+    from fake_model import DEFAULT_RESPONSE
+
+    rng = random.Random(args.seed)
+    users = [f"loadtest-{i}" for i in range(args.users)]
+    prompts = [rng.choice(CODE_PROMPTS + OTHER_PROMPTS) for _ in range(20000)]
+    response = "Here's an implementation:\n\n" + DEFAULT_RESPONSE * 8 + "\nIt sorts the values.\n"
+
+    phases = {
+        'classify': run_serial(is_code_request, prompts),
+        'code_blocks': run_serial(extract_code_blocks, [response] * 5000),
+        'sessions': bench_sessions(engine, users, args.turns, response)
+    }
+    if args.mode == "apptest":
+        phases['submit'] = bench_submit_apptest(users, args.turns, args.seed, args.timeout)
+    else:
+        phases['submit'] = bench_submit_engine(engine, users, args.turns, args.seed)
+    return phases
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test CodeCraft AI against the local fake model")
+    parser.add_argument("--mode", choices=("engine", "apptest"), default="engine",
+                        help="submit through the engine, or through the Streamlit script with AppTest")
+    parser.add_argument("--users", type=int, default=8, help="simulated concurrent users")
+    parser.add_argument("--turns", type=int, default=10, help="prompts per user")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake model latency in seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=500.0, help="fake model token rate")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of fake model calls that fail")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--backend", choices=("sqlite", "json"), default="sqlite", help="session store backend")
+    parser.add_argument("--timeout", type=float, default=30.0, help="AppTest script run timeout")
+    parser.add_argument("--no-save", action="store_true", help="don't append the results to " + RESULTS_FILE)
+    args = parser.parse_args(argv)
+
+    if args.mode == "apptest" and not apptest_available():
+        parser.error("--mode apptest needs Streamlit %d.%d or newer" % APPTEST_MIN_VERSION)
+
+    config = {key: getattr(args, key) for key in CONFIG_KEYS}
+    commit, dirty = git_revision()
+
+    # The engine reads its settings when imported, and keeps its session
+    # files and response cache in the working directory
+    os.environ.update({
+        "CODECRAFT_FAKE_MODEL": "1",
+        "CODECRAFT_FAKE_LATENCY": str(args.latency),
+        "CODECRAFT_FAKE_TOKENS_PER_SECOND": str(args.tokens_per_second),
+        "CODECRAFT_FAKE_ERROR_RATE": str(args.error_rate),
+        "CODECRAFT_FAKE_SEED": str(args.seed),
+        "CODECRAFT_SESSION_BACKEND": args.backend,
+        "CODECRAFT_STREAM": "0"
+    })
+    previous_cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="codecraft-loadtest-")
+    os.chdir(workdir)
+    try:
+        phases = run_phases(args)
+    finally:
+        os.chdir(previous_cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    # p95 of the fake model calls themselves, per model
+    model_calls = {row['labels'].get('model'): round(row['p95'] * 1000, 3)
+                   for row in metrics.snapshot() if row['name'] == "model_call.seconds" and row['count']}
+    result = {
+        'commit': commit,
+        'dirty': dirty,
+        'time': datetime.now().isoformat(timespec="seconds"),
+        'config': config,
+        'phases': phases,
+        'model_call_p95_ms': model_calls,
+        'max_rss_mb': max_rss_mb()
+    }
+
+    previous = previous_result(config)
+    print_report(result, previous)
+    if not args.no_save:
+        os.makedirs(os.path.dirname(RESULTS_FILE), exist_ok=True)
+        with open(RESULTS_FILE, "a") as f:
+            f.write(json.dumps(result) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+import time
+import uuid
+from collections.abc import Mapping
+from datetime import datetime
+from enum import IntEnum
+
+# How message times are shown (and how they were stored before messages
+# kept epoch times)
+TIMESTAMP_FORMAT = "%I:%M %p · %d %b %Y"
+
+# Keys a message can be read with
+MESSAGE_KEYS = ('id', 'role', 'content', 'timestamp')
+
+
+class Role(IntEnum):
+    USER = 0
+    ASSISTANT = 1
+
+
+# Function to convert a stored role (name or number) to a Role
+def parse_role(role):
+    if isinstance(role, str):
+        return Role[role.upper()]
+    return Role(role)
+
+
+# Function to convert a display timestamp from older sessions to epoch
+# seconds; None if it can't be read
+def parse_timestamp(timestamp):
+    if not timestamp:
+        return None
+    if isinstance(timestamp, (int, float)):
+        return float(timestamp)
+    try:
+        return datetime.strptime(timestamp, TIMESTAMP_FORMAT).timestamp()
+    except ValueError:
+        return None
+
+
+# A chat message. Whole histories are held in memory (per browser session
+# and in the store's cache), so messages have no per-instance dict: the role
+# is a small integer and the time an epoch float, formatted only when read.
+# Messages are immutable and read like the dicts they replace, e.g.
+# message['role'] == 'user' and message['timestamp'].
+class Message(Mapping):
+    __slots__ = ('id', 'role', 'content', 'created')
+
+    def __init__(self, id, role, content, created=None):
+        object.__setattr__(self, 'id', id)
+        object.__setattr__(self, 'role', parse_role(role))
+        object.__setattr__(self, 'content', content)
+        object.__setattr__(self, 'created', created)
+
+    # Function to build a new message with a fresh id, created now unless
+    # given a time
+    @classmethod
+    def create(cls, role, content, created=None):
+        return cls(str(uuid.uuid4()), role, content, time.time() if created is None else created)
+
+    # Function to build a message from its dict form (as stored by the JSON
+    # backend and returned by the API)
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['id'], data['role'], data['content'], parse_timestamp(data.get('timestamp')))
+
+    @property
+    def timestamp(self):
+        if self.created is None:
+            return ""
+        return datetime.fromtimestamp(self.created).strftime(TIMESTAMP_FORMAT)
+
+    def to_dict(self):
+        return {'id': self.id, 'role': self.role.name.lower(), 'content': self.content, 'timestamp': self.timestamp}
+
+    def __getitem__(self, key):
+        if key == 'id':
+            return self.id
+        if key == 'role':
+            return self.role.name.lower()
+        if key == 'content':
+            return self.content
+        if key == 'timestamp':
+            return self.timestamp
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(MESSAGE_KEYS)
+
+    def __len__(self):
+        return len(MESSAGE_KEYS)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("messages are immutable")
+
+    def __repr__(self):
+        return f"Message(id={self.id!r}, role={self.role.name.lower()!r}, content={self.content[:40]!r}...)"
+
+    def __reduce__(self):
+        return (Message, (self.id, self.role, self.content, self.created))
@@ -0,0 +1,95 @@
+import re
+from collections import namedtuple
+
+# List of code-related keywords
+CODE_KEYWORDS = (
+    'code', 'function', 'program', 'script', 'algorithm', 'class', 'method',
+    'implement', 'develop', 'build', 'create a', 'write a', 'generate a',
+    'python', 'javascript', 'html', 'css', 'java', 'c++', 'c#', 'ruby', 'php',
+    'typescript', 'swift', 'kotlin', 'rust', 'go', 'dart', 'react', 'angular',
+    'vue', 'node', 'django', 'flask', 'express', 'api', 'database', 'sql',
+    'mongodb', 'json', 'xml', 'app', 'application', 'git', 'docker', 'aws',
+    'azure', 'tensorflow', 'pytorch', 'numpy', 'pandas', 'scikit', 'matplotlib',
+    'selenium', 'beautiful soup', 'regex', 'rest', 'graphql', 'web scraping'
+)
+
+# Non-code patterns (questions about theory, explanations, etc.)
+NON_CODE_PATTERNS = (
+    'explain about', 'what is', 'tell me about', 'how does', 'describe',
+    'history of', 'difference between', 'compare', 'advantages of',
+    'disadvantages', 'pros and cons', 'benefits of', 'drawbacks of',
+    'when to use', 'why use', 'definition of', 'meaning of', 'features of',
+    'characteristics', 'theory', 'concept', 'principles', 'explain'
+)
+
+# Verbs that match with any ending ("implementing", "programmer", "builds");
+# shorter keywords such as "go" and "app" only match as whole words
+STEM_KEYWORDS = ('implement', 'program', 'develop', 'build')
+
+# Inflections of keywords that don't follow the plural rule, and the "an"
+# form of the phrases ending in "a"
+KEYWORD_FORMS = {
+    'code': ('coded', 'coding'),
+    'create a': ('create an',), 'write a': ('write an',), 'generate a': ('generate an',),
+}
+
+Classification = namedtuple('Classification', ['is_code', 'code_terms', 'non_code_terms'])
+
+
+# Function to expand a keyword with its plural ("class" -> "classes", "app" -> "apps")
+# and any other listed forms; phrases only take their listed forms
+def _word_forms(keyword):
+    if " " in keyword:
+        return (keyword,) + KEYWORD_FORMS.get(keyword, ())
+    plural = keyword + "es" if keyword.endswith("s") else keyword + "s"
+    return (keyword, plural) + KEYWORD_FORMS.get(keyword, ())
+
+
+# Function to build a regex alternation factored by common prefixes, so the
+# engine walks one character trie instead of trying every alternative
+def _trie_pattern(words):
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def build(node):
+        alternatives = [re.escape(char) + build(child)
+                        for char, child in sorted(node.items()) if char]
+        if not alternatives:
+            return ''
+        body = alternatives[0] if len(alternatives) == 1 else '(?:' + '|'.join(alternatives) + ')'
+        return '(?:' + body + ')?' if '' in node else body
+
+    return build(trie)
+
+
+# Both regexes are compiled once at import and run over the lowercased prompt.
+# Keywords must match whole words so "go" doesn't match "good" and "app"
+# doesn't match "happy", except the verb stems, which take any ending;
+# non-code patterns only need to start at a word so "describe" still matches
+# "describes".
+_KEYWORD_RE = re.compile(
+    r"\b(?:" + _trie_pattern([form for keyword in CODE_KEYWORDS if keyword not in STEM_KEYWORDS
+                              for form in _word_forms(keyword)]) + r"(?!\w)"
+    + r"|" + _trie_pattern(STEM_KEYWORDS) + r"\w*)"
+)
+_NON_CODE_RE = re.compile(r"\b" + _trie_pattern(NON_CODE_PATTERNS))
+
+
+# Function to check if prompt is requesting code
+def is_code_request(prompt):
+    prompt = prompt.lower()
+    
+    # Return True if it has code keywords and doesn't match non-code patterns
+    return _NON_CODE_RE.search(prompt) is None and _KEYWORD_RE.search(prompt) is not None
+
+
+# Function to classify a prompt and report which terms drove the decision
+def classify(prompt):
+    prompt = prompt.lower()
+    code_terms = _KEYWORD_RE.findall(prompt)
+    non_code_terms = _NON_CODE_RE.findall(prompt)
+    return Classification(bool(code_terms) and not non_code_terms, code_terms, non_code_terms)
@@ -0,0 +1,184 @@
+import argparse
+import sys
+
+from dotenv import load_dotenv
+
+# Load environment variables before the engine reads its settings
+load_dotenv()
+
+import batch
+import engine
+import prompts
+
+
+# Function to read a prompt argument, or stdin when it is "-"
+def read_prompt(value):
+    return sys.stdin.read() if value == "-" else value
+
+
+# Function to print a response, or only its code blocks
+def print_response(text, code_only=False):
+    if not code_only:
+        print(text)
+        return
+    for _, code in engine.code_blocks(text):
+        print(code)
+
+
+def cmd_generate(args):
+    prompt = read_prompt(args.prompt)
+    template = engine.get_template(args.template)
+    if args.stream and not args.code_only:
+        for text in engine.generate_code_stream(prompt, template=template, use_cache=not args.no_cache):
+            sys.stdout.write(text)
+            sys.stdout.flush()
+        print()
+        return 0
+    print_response(engine.generate_code(prompt, use_cache=not args.no_cache, template=template), args.code_only)
+    return 0
+
+
+def cmd_classify(args):
+    result = engine.classify(read_prompt(args.prompt))
+    print("code" if result.is_code else "not code")
+    if result.code_terms:
+        print("code terms: " + ", ".join(result.code_terms))
+    if result.non_code_terms:
+        print("non-code terms: " + ", ".join(result.non_code_terms))
+    return 0
+
+
+def cmd_chat(args):
+    message = engine.chat(args.session_id, read_prompt(args.prompt), use_cache=not args.no_cache,
+                          template=engine.get_template(args.template), user=args.user)
+    print_response(message['content'], args.code_only)
+    return 0
+
+
+def cmd_batch(args):
+    def show_progress(result):
+        status = "error" if 'error' in result else ("ok" if result['is_code'] else "not code")
+        print(f"{result['id']}: {status} ({result['seconds']:.1f}s)", file=sys.stderr)
+
+    report = batch.run_batch(args.input, args.output, concurrency=args.concurrency,
+                             per_minute=args.rpm, use_cache=not args.no_cache, on_result=show_progress)
+    print(f"{report['completed']} generated, {report['non_code']} not code, {report['failed']} failed, "
+          f"{report['resumed']} already done; {report['prompts_per_minute']} prompts/min "
+          f"over {report['seconds']:.1f}s")
+    return 1 if report['failed'] else 0
+
+
+def cmd_sessions_list(args):
+    sessions, _ = engine.recent_sessions(args.user)
+    for session in sessions:
+        print(f"{session['id']}  {session['last_updated'][:16]}  {session['title']}")
+    return 0
+
+
+def cmd_sessions_search(args):
+    for result in engine.search_sessions(args.query, args.user, args.limit):
+        where = "title" if result['message_id'] is None else result['role']
+        print(f"{result['session_id']}  [{where}]  {result['title']}")
+        if result['message_id'] is not None:
+            print("    " + " ".join(result['snippet'].split()))
+    return 0
+
+
+def cmd_sessions_show(args):
+    for message in engine.load_session_messages(args.session_id, args.user):
+        speaker = "You" if message['role'] == 'user' else "CodeCraft AI"
+        print(f"--- {speaker} · {message['timestamp']}")
+        print(message['content'])
+    return 0
+
+
+def cmd_sessions_create(args):
+    print(engine.create_session(args.title, args.user)['id'])
+    return 0
+
+
+def cmd_sessions_rename(args):
+    if engine.rename_session(args.session_id, args.title, args.user) is None:
+        print(f"No session {args.session_id}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def cmd_sessions_delete(args):
+    engine.delete_session(args.session_id, args.user)
+    return 0
+
+
+# Function to build the command line parser
+def build_parser():
+    parser = argparse.ArgumentParser(prog="codecraft", description="CodeCraft AI code generation from the command line")
+    parser.add_argument("--user", default=engine.DEFAULT_USER, help="user whose sessions to use")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_generation_options(command):
+        command.add_argument("--template", choices=list(prompts.TEMPLATES), help="prompt template to use")
+        command.add_argument("--no-cache", action="store_true", help="generate a fresh response")
+        command.add_argument("--code-only", action="store_true", help="print only the code blocks")
+
+    generate = commands.add_parser("generate", help="generate code for a prompt (- reads stdin)")
+    generate.add_argument("prompt")
+    generate.add_argument("--stream", action="store_true", help="print the response as it is generated")
+    add_generation_options(generate)
+    generate.set_defaults(func=cmd_generate)
+
+    classify = commands.add_parser("classify", help="check whether a prompt asks for code")
+    classify.add_argument("prompt")
+    classify.set_defaults(func=cmd_classify)
+
+    run_batch = commands.add_parser("batch", help="generate code for a JSONL file of prompts")
+    run_batch.add_argument("input", help="JSONL file of prompts")
+    run_batch.add_argument("output", help="JSONL file results are appended to; existing results are skipped")
+    run_batch.add_argument("--concurrency", type=int, default=batch.DEFAULT_CONCURRENCY, help="prompts generated at once")
+    run_batch.add_argument("--rpm", type=int, help="maximum requests started per minute")
+    run_batch.add_argument("--no-cache", action="store_true", help="generate fresh responses")
+    run_batch.set_defaults(func=cmd_batch)
+
+    chat = commands.add_parser("chat", help="send a prompt in a stored session")
+    chat.add_argument("session_id")
+    chat.add_argument("prompt")
+    add_generation_options(chat)
+    chat.set_defaults(func=cmd_chat)
+
+    sessions = commands.add_parser("sessions", help="manage stored sessions")
+    session_commands = sessions.add_subparsers(dest="session_command", required=True)
+    session_commands.add_parser("list").set_defaults(func=cmd_sessions_list)
+    show = session_commands.add_parser("show")
+    show.add_argument("session_id")
+    show.set_defaults(func=cmd_sessions_show)
+    search = session_commands.add_parser("search", help="search titles, messages and code languages")
+    search.add_argument("query")
+    search.add_argument("--limit", type=int, default=engine.SEARCH_LIMIT)
+    search.set_defaults(func=cmd_sessions_search)
+    create = session_commands.add_parser("create")
+    create.add_argument("title", nargs="?")
+    create.set_defaults(func=cmd_sessions_create)
+    rename = session_commands.add_parser("rename")
+    rename.add_argument("session_id")
+    rename.add_argument("title")
+    rename.set_defaults(func=cmd_sessions_rename)
+    delete = session_commands.add_parser("delete")
+    delete.add_argument("session_id")
+    delete.set_defaults(func=cmd_sessions_delete)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except KeyError as e:
+        print(f"No session {e.args[0]}", file=sys.stderr)
+        return 1
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
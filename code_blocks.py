@@ -0,0 +1,121 @@
+import re
+import threading
+from collections import OrderedDict, namedtuple
+
+# A piece of a response: prose (is_code False) or a fenced code block
+Segment = namedtuple('Segment', ['language', 'text', 'is_code'])
+
+# Fence lines: up to three spaces of indent, three or more backticks or
+# tildes, then an optional info string (the language for opening fences).
+# Matching from the preceding newline lets the regex engine skip ahead to
+# newlines instead of trying a line-start anchor at every position.
+_FENCE_RE = re.compile(r"\n {0,3}(`{3,}|~{3,})([^\n]*)")
+_FIRST_FENCE_RE = re.compile(r" {0,3}(`{3,}|~{3,})([^\n]*)")
+
+# Maximum number of messages whose parsed segments are kept in memory
+MAX_CACHED_MESSAGES = 2048
+
+# Parsed segments shared by every session in the process, keyed by message
+# id and holding the text they were parsed from
+_segment_cache = OrderedDict()
+_segment_lock = threading.Lock()
+
+
+# Function to yield (line_start, line_end, marker, info) for each fence line
+def _fence_lines(text):
+    match = _FIRST_FENCE_RE.match(text)
+    if match:
+        yield 0, match.end(), match.group(1), match.group(2)
+    for match in _FENCE_RE.finditer(text):
+        yield match.start() + 1, match.end(), match.group(1), match.group(2)
+
+
+# Function to split text into prose and code segments in a single pass over
+# the fence lines. Returns (segments, final_count, final_end): the first
+# final_count segments end at a closed fence at offset final_end and can no
+# longer change if more text is appended.
+def _tokenize(text):
+    segments = []
+    final_count = 0
+    final_end = 0
+    prose_start = 0
+    fence = None
+    language = ""
+    code_start = 0
+
+    for line_start, line_end, marker, info in _fence_lines(text):
+        info = info.strip()
+
+        if fence is None:
+            # A backtick fence's info string can't contain backticks
+            if marker[0] == "`" and "`" in info:
+                continue
+            if text[prose_start:line_start].strip():
+                segments.append(Segment("", text[prose_start:line_start], False))
+            fence = marker
+            language = info.split(None, 1)[0] if info else ""
+            code_start = line_end + 1
+        elif marker[0] == fence[0] and len(marker) >= len(fence) and not info:
+            segments.append(Segment(language, text[code_start:max(code_start, line_start - 1)], True))
+            fence = None
+            prose_start = line_end
+            # A fence at the very end could still grow into an opening fence
+            if line_end < len(text):
+                final_count = len(segments)
+                final_end = line_end
+
+    if fence is not None:
+        # Unterminated fence: everything after it is code
+        segments.append(Segment(language, text[code_start:], True))
+    elif text[prose_start:].strip():
+        segments.append(Segment("", text[prose_start:], False))
+
+    return segments, final_count, final_end
+
+
+# Function to detect code in a response
+def extract_code_blocks(text):
+    return _tokenize(text)[0]
+
+
+# Function to get a message's segments, parsing it only if its text changed
+# since the last call. Reruns re-render the whole chat history, so this
+# keeps them from re-parsing messages that were already parsed.
+def cached_code_blocks(message_id, text):
+    with _segment_lock:
+        entry = _segment_cache.get(message_id)
+        if entry is not None and (entry[0] is text or entry[0] == text):
+            _segment_cache.move_to_end(message_id)
+            return entry[1]
+
+    segments = extract_code_blocks(text)
+    with _segment_lock:
+        _segment_cache[message_id] = (text, segments)
+        _segment_cache.move_to_end(message_id)
+        while len(_segment_cache) > MAX_CACHED_MESSAGES:
+            _segment_cache.popitem(last=False)
+    return segments
+
+
+# Incremental parser for streamed responses. Segments that end at a closed
+# fence are kept and never re-parsed; only the text after the last closed
+# fence is tokenized again when a chunk arrives.
+class StreamingCodeBlockParser:
+    def __init__(self):
+        self._done = []
+        self._tail = ""
+        self._tail_segments = []
+
+    # Add a chunk of text and return the segments parsed so far
+    def feed(self, chunk):
+        self._tail += chunk
+        segments, final_count, final_end = _tokenize(self._tail)
+        if final_count:
+            self._done.extend(segments[:final_count])
+            segments = segments[final_count:]
+            self._tail = self._tail[final_end:]
+        self._tail_segments = segments
+        return self.segments()
+
+    def segments(self):
+        return self._done + self._tail_segments
@@ -0,0 +1,62 @@
+# Default number of tokens of prior conversation sent with each request
+CONTEXT_TOKEN_BUDGET = 2000
+
+# Longest a single prior turn may be before it is truncated
+MAX_TURN_TOKENS = 600
+
+# Part of the budget reserved for the rolling summary of older turns
+SUMMARY_SHARE = 0.25
+
+
+# Function to approximate a token count (about four characters per token)
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+# Function to shorten text to roughly max_tokens tokens
+def truncate_to_tokens(text, max_tokens):
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars] + "\n...[truncated]"
+
+
+# Function to format a message as a line of conversation
+def format_turn(message):
+    speaker = "User" if message['role'] == 'user' else "Assistant"
+    return f"{speaker}: {truncate_to_tokens(message['content'], MAX_TURN_TOKENS)}"
+
+
+# Function to find where the most recent turns that fit the budget start.
+# Everything before the returned index is left to the rolling summary.
+def recent_turns_start(messages, budget=CONTEXT_TOKEN_BUDGET):
+    budget -= int(budget * SUMMARY_SHARE)
+    start = len(messages)
+    for idx in range(len(messages) - 1, -1, -1):
+        cost = estimate_tokens(format_turn(messages[idx]))
+        if cost > budget:
+            break
+        budget -= cost
+        start = idx
+    return start
+
+
+# Function to assemble the conversation context for a request from the
+# rolling summary of older turns and the recent turns that fit the budget.
+# Returns (context_text, context_tokens).
+def build_context(messages, summary=None, budget=CONTEXT_TOKEN_BUDGET):
+    if not messages:
+        return "", 0
+
+    parts = []
+    start = recent_turns_start(messages, budget)
+    if summary and start > 0:
+        summary = truncate_to_tokens(summary, int(budget * SUMMARY_SHARE))
+        parts.append(f"Summary of the earlier conversation:\n{summary}")
+
+    if start < len(messages):
+        turns = "\n\n".join(format_turn(message) for message in messages[start:])
+        parts.append(f"Recent conversation:\n{turns}")
+
+    context_text = "\n\n".join(parts)
+    return context_text, estimate_tokens(context_text) if context_text else 0
@@ -0,0 +1,624 @@
+import hashlib
+import os
+import re
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import background
+import context
+import fake_model
+import gemini_client
+import metrics
+import prompts
+import response_cache
+from chat_message import Message
+from classifier import classify, is_code_request
+from code_blocks import extract_code_blocks
+from router import TASK_SUMMARY, TASK_TITLE, get_router
+from session_store import SEARCH_LIMIT, open_store
+from singleflight import INTERRUPTED, SingleFlight
+
+# Code generation engine shared by the Streamlit UI, the CLI and the HTTP
+# API. Importing it has no side effects: the Gemini SDK is imported and
+# configured on the first model call, and stores and caches are opened on
+# first use. Settings are read from the environment at import time, so entry
+# points load .env before importing this module.
+
+# Use the correct free model name - gemini-1.5-flash instead of gemini-pro
+MODEL_NAME = 'gemini-1.5-flash'
+
+# Serve every model call from the local fake model (no API key or network)
+USE_FAKE_MODEL = os.getenv("CODECRAFT_FAKE_MODEL", "0") == "1"
+
+# File paths for storing session data
+SESSION_DATA_FILE = "codecraft_sessions.json"
+SESSION_DB_FILE = "codecraft_sessions.db"
+
+# Storage backend: "sqlite" (default) or the legacy whole-file "json"
+SESSION_BACKEND = os.getenv("CODECRAFT_SESSION_BACKEND", "sqlite")
+
+# Sessions are partitioned by user: the default user keeps the files above,
+# every other user gets their own shard file in this directory
+DEFAULT_USER = "default"
+SESSION_SHARD_DIR = os.getenv("CODECRAFT_SESSION_DIR", "codecraft_sessions")
+
+# Deadlines for model calls in seconds
+CODE_TIMEOUT = 120
+TITLE_TIMEOUT = 15
+SUMMARY_TIMEOUT = 30
+LIST_MODELS_TIMEOUT = 15
+
+# Tokens of prior conversation sent with each request
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CODECRAFT_CONTEXT_TOKENS", context.CONTEXT_TOKEN_BUDGET))
+
+# Prompt template used for code requests (see prompts.TEMPLATES)
+PROMPT_TEMPLATE = os.getenv("CODECRAFT_PROMPT_TEMPLATE", prompts.DEFAULT_TEMPLATE)
+
+# On-disk cache of generated responses
+RESPONSE_CACHE_FILE = "codecraft_response_cache.db"
+
+# Reply to prompts that don't ask for code
+NON_CODE_RESPONSE = """
+I'm CodeCraft AI, designed specifically to help you generate code. I can't provide explanations about concepts, theories, or general information.
+
+Please rephrase your request to ask for specific code implementation, such as:
+- "Create a Python function to..."
+- "Write JavaScript code that..."
+- "Build an HTML form with..."
+
+For general information, you might want to use a different AI assistant or search engine.
+"""
+
+# Use the safety settings appropriate for code generation
+SAFETY_SETTINGS = [
+    {
+        "category": "HARM_CATEGORY_HARASSMENT",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    },
+    {
+        "category": "HARM_CATEGORY_HATE_SPEECH",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    },
+    {
+        "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    },
+    {
+        "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    }
+]
+
+# Picks the model for each task and falls back to the next one on failure
+router = get_router()
+
+# Identical code requests in flight at the same time share one model call
+flights = SingleFlight("generate_code.singleflight")
+
+_configured = False
+_configure_lock = threading.Lock()
+
+
+# Raised when the model API can't be configured (e.g. no API key)
+class ConfigurationError(Exception):
+    pass
+
+
+# Function to check that the model API can be configured, without
+# importing the SDK; configure() runs on the first model call
+def check_configuration(api_key=None):
+    if not USE_FAKE_MODEL and not (api_key or os.getenv("GEMINI")):
+        raise ConfigurationError("GEMINI_API_KEY is not set in the .env file!")
+
+
+# Function to configure the Gemini SDK once per process; a no-op with the
+# fake model
+def configure(api_key=None):
+    global _configured
+    if USE_FAKE_MODEL:
+        return
+    with _configure_lock:
+        if _configured:
+            return
+        check_configuration(api_key)
+        api_key = api_key or os.getenv("GEMINI")
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        _configured = True
+
+
+# Function to create a model, or the local fake model in offline mode
+def create_model(model_name, system_instruction=None):
+    if USE_FAKE_MODEL:
+        return fake_model.FakeModel(model_name=model_name, **fake_model.settings_from_env())
+    configure()
+    import google.generativeai as genai
+    if system_instruction:
+        return genai.GenerativeModel(model_name, system_instruction=system_instruction)
+    return genai.GenerativeModel(model_name)
+
+
+# Function to get the shared client for a model (with timeouts, retries and
+# a process-wide concurrency limit)
+def get_model_client(model_name):
+    return gemini_client.get_client(model_name, lambda: create_model(model_name))
+
+
+# Function to get the client whose model carries a template's system
+# instruction; created once per process, model and template version
+def get_template_client(template, model_name=MODEL_NAME):
+    return gemini_client.get_client(
+        f"{model_name}/{prompts.template_id(template)}",
+        lambda: create_model(model_name, template.system_instruction)
+    )
+
+
+# Function to list available models
+def list_available_models():
+    if USE_FAKE_MODEL:
+        return sorted({name for names in router.routes.values() for name in names})
+
+    def list_models():
+        import google.generativeai as genai
+        return [model.name for model in genai.list_models()]
+
+    configure()
+    return get_model_client(MODEL_NAME).call_sync(list_models, timeout=LIST_MODELS_TIMEOUT)
+
+
+# Function to look up a template by name, defaulting to PROMPT_TEMPLATE
+def get_template(name=None):
+    return prompts.get_template(name or PROMPT_TEMPLATE)
+
+
+# Function to pick the routing task for a code request from its size
+def code_task(template, request_text):
+    input_tokens = context.estimate_tokens(template.system_instruction) + context.estimate_tokens(request_text)
+    return router.code_task(input_tokens, template.generation_config.get("max_output_tokens", 0))
+
+
+# Function to build the prompt and generation settings for a code request
+def build_code_request(prompt, context_text="", template=None):
+    template = template or get_template()
+
+    # Only the request is sent per call; the template's static instructions
+    # are the model's system instruction
+    request_text = prompts.render_request(template, prompt, context_text)
+    generation_config = router.generation_config(code_task(template, request_text), template.generation_config)
+    return request_text, generation_config, SAFETY_SETTINGS
+
+
+# Function to get the on-disk response cache
+def get_response_cache():
+    return response_cache.get_cache(RESPONSE_CACHE_FILE)
+
+
+# Function to build the response cache key for a request
+def response_cache_key(prompt, generation_config, context_text, template):
+    return response_cache.make_key(
+        prompt, router.primary(code_task(template, prompts.render_request(template, prompt, context_text))),
+        generation_config,
+        context=context_text, template=prompts.template_id(template)
+    )
+
+
+# Function to look up a previously generated response for a prompt
+def get_cached_response(prompt, generation_config, context_text="", template=None):
+    try:
+        key = response_cache_key(prompt, generation_config, context_text, template or get_template())
+        with metrics.timed("storage.seconds", op="response_cache_get"):
+            cached = get_response_cache().get(key)
+    except Exception:
+        return None
+    metrics.increment("response_cache.hits" if cached is not None else "response_cache.misses")
+    return cached
+
+
+# Function to store a generated response for a prompt
+def cache_response(prompt, generation_config, response, context_text="", template=None):
+    try:
+        key = response_cache_key(prompt, generation_config, context_text, template or get_template())
+        with metrics.timed("storage.seconds", op="response_cache_put"):
+            get_response_cache().put(key, response)
+    except Exception:
+        pass
+
+
+# Function to record the input and output tokens of a response per template
+def record_template_tokens(template, request_text, response_text):
+    # The system instruction is billed as input on every call
+    input_tokens = context.estimate_tokens(template.system_instruction) + context.estimate_tokens(request_text)
+    metrics.record("generate_code.input_tokens", input_tokens)
+    metrics.record(f"prompt_template.{template.name}.input_tokens", input_tokens)
+    metrics.record(f"prompt_template.{template.name}.output_tokens", context.estimate_tokens(response_text))
+
+
+# Function to generate code; errors from the model are raised
+def generate_code(prompt, use_cache=True, context_text="", template=None):
+    template = template or get_template()
+    request_text, generation_config, safety_settings = build_code_request(prompt, context_text, template)
+
+    def generate():
+        # One deadline covers the fallback models too
+        deadline = gemini_client.call_deadline(CODE_TIMEOUT)
+        try:
+            response = router.call(
+                code_task(template, request_text),
+                lambda model_name: get_template_client(template, model_name).generate_sync(
+                    request_text,
+                    deadline=deadline,
+                    generation_config=generation_config,
+                    safety_settings=safety_settings
+                ),
+                deadline
+            )
+        except Exception:
+            metrics.increment("generate_code.errors")
+            raise
+
+        record_template_tokens(template, request_text, response.text)
+        cache_response(prompt, generation_config, response.text, context_text, template)
+        return response.text
+
+    # Skipping the cache asks for a fresh response, so it isn't shared either
+    if not use_cache:
+        return generate()
+
+    # Serve repeated prompts from the response cache, and share the model
+    # call between identical requests that arrive while it is in flight
+    cached = get_cached_response(prompt, generation_config, context_text, template)
+    if cached is not None:
+        return cached
+    return flights.do(response_cache_key(prompt, generation_config, context_text, template), generate)
+
+
+# Function to generate code as a stream of text chunks; errors from the
+# model are raised, after any chunks already streamed. Cached responses, and
+# responses to identical requests already in flight, arrive as one chunk.
+def generate_code_stream(prompt, context_text="", template=None, use_cache=True):
+    template = template or get_template()
+    request_text, generation_config, safety_settings = build_code_request(prompt, context_text, template)
+
+    flight_key = None
+    if use_cache:
+        cached = get_cached_response(prompt, generation_config, context_text, template)
+        if cached is not None:
+            yield cached
+            return
+
+        # Wait for an identical request that is already being generated
+        # instead of starting another one
+        flight_key = response_cache_key(prompt, generation_config, context_text, template)
+        flight, leader = flights.begin(flight_key)
+        if not leader:
+            yield flight.result()
+            return
+
+    chunks = []
+    start = time.perf_counter()
+    # Stays set if the caller stops reading before the stream ends
+    error = INTERRUPTED
+    try:
+        # Falls back to the next model only if no text has been streamed yet
+        deadline = gemini_client.call_deadline(CODE_TIMEOUT)
+        for text in router.stream(
+            code_task(template, request_text),
+            lambda model_name: get_template_client(template, model_name).stream_sync(
+                request_text,
+                deadline=deadline,
+                generation_config=generation_config,
+                safety_settings=safety_settings
+            ),
+            deadline
+        ):
+            if not chunks:
+                metrics.record("generate_code.time_to_first_token", time.perf_counter() - start)
+            chunks.append(text)
+            yield text
+        error = None
+    except Exception as e:
+        error = e
+        metrics.increment("generate_code.errors")
+        raise
+    finally:
+        # Share the result (or error) with requests that joined this one
+        if flight_key is not None:
+            flights.finish(flight_key, "".join(chunks), error)
+
+    # Only complete responses are cached
+    response_text = "".join(chunks)
+    metrics.record("generate_code.total_time", time.perf_counter() - start)
+    record_template_tokens(template, request_text, response_text)
+    cache_response(prompt, generation_config, response_text, context_text, template)
+
+
+# Verbs that ask for a change to code already in the session; a follow-up
+# either starts with one ("Now add tests", "Can you make it async?") or uses
+# one on a reference to that code ("I need this to run in parallel")
+FOLLOW_UP_VERBS = (
+    'add', 'change', 'convert', 'extend', 'fix', 'handle', 'include', 'make',
+    'modify', 'move', 'optimize', 'refactor', 'remove', 'rename', 'replace',
+    'rewrite', 'split', 'support', 'translate', 'turn', 'update', 'use', 'wrap',
+)
+_EDIT_VERB = r"(?:" + "|".join(FOLLOW_UP_VERBS) + r")\b"
+_FOLLOW_UP_START_RE = re.compile(
+    r"\s*(?:(?:please|now|also|and|then|ok|okay|can you|could you|would you)\b[\s,]*)*" + _EDIT_VERB
+)
+_EDIT_VERB_RE = re.compile(r"\b" + _EDIT_VERB)
+_CODE_REFERENCE_RE = re.compile(r"\b(?:it|this|the (?:code|function|script|class|program))\b")
+
+
+# Function to check if a prompt asks to change code earlier in the session
+def is_follow_up_request(prompt, history):
+    has_code = any(
+        message['role'] == 'assistant' and '```' in message['content']
+        for message in history[-4:]
+    )
+    if not has_code or classify(prompt).non_code_terms:
+        return False
+    prompt = prompt.lower()
+    return bool(_FOLLOW_UP_START_RE.match(prompt)
+                or (_EDIT_VERB_RE.search(prompt) and _CODE_REFERENCE_RE.search(prompt)))
+
+
+# Function to decide whether a prompt should be answered with code
+def wants_code(prompt, history=()):
+    return is_code_request(prompt) or is_follow_up_request(prompt, list(history))
+
+
+# Function to generate auto session title
+def generate_session_title(first_message):
+    try:
+        prompt = f"""
+        Create a short, concise title (3-5 words) that summarizes the following message content.
+        The title should be specific enough to identify the general topic but brief enough to serve as a chat session name.
+
+        Message: {first_message}
+
+        Return ONLY the title with no quotes, explanation, or additional text.
+        """
+
+        deadline = gemini_client.call_deadline(TITLE_TIMEOUT)
+        response = router.call(TASK_TITLE, lambda model_name: get_model_client(model_name).generate_sync(
+            prompt,
+            deadline=deadline,
+            generation_config=router.generation_config(TASK_TITLE)
+        ), deadline)
+
+        title = response.text.strip()
+
+        # Limit length and clean up title
+        if len(title) > 50:
+            title = title[:47] + "..."
+
+        return title
+    except Exception:
+        # Fallback title with timestamp
+        return f"CodeCraft Session {datetime.now().strftime('%b %d, %H:%M')}"
+
+
+# Function to fold older turns into the rolling summary
+def summarize_turns(previous_summary, messages):
+    try:
+        turns = "\n\n".join(context.format_turn(message) for message in messages)
+        prompt = f"""
+        Update the summary of a conversation between a user and a code generation assistant.
+        Keep the languages, libraries, names, requirements and decisions that later requests may refer to.
+        Use at most 150 words and return ONLY the summary.
+
+        Current summary: {previous_summary or "(none)"}
+
+        New turns:
+        {turns}
+        """
+
+        deadline = gemini_client.call_deadline(SUMMARY_TIMEOUT)
+        response = router.call(TASK_SUMMARY, lambda model_name: get_model_client(model_name).generate_sync(
+            prompt,
+            deadline=deadline,
+            generation_config=router.generation_config(TASK_SUMMARY)
+        ), deadline)
+        return response.text.strip()
+    except Exception:
+        return None
+
+
+# Function to get a user's shard file name: readable, safe on any file
+# system, and distinct for user keys that only differ in unsafe characters
+def user_shard(user):
+    slug = re.sub(r"[^A-Za-z0-9_-]", "_", user)[:40]
+    return f"{slug}-{hashlib.sha256(user.encode('utf-8')).hexdigest()[:12]}"
+
+
+# Function to use the session store holding a user's sessions in a with
+# block; the store stays open until the block ends
+def open_session_store(user=None):
+    if not user or user == DEFAULT_USER:
+        if SESSION_BACKEND == "json":
+            return open_store("json", SESSION_DATA_FILE)
+        # The legacy JSON file is imported into the database on first open
+        return open_store("sqlite", SESSION_DB_FILE, legacy_json_path=SESSION_DATA_FILE)
+
+    os.makedirs(SESSION_SHARD_DIR, exist_ok=True)
+    extension = "json" if SESSION_BACKEND == "json" else "db"
+    return open_store(SESSION_BACKEND, os.path.join(SESSION_SHARD_DIR, f"{user_shard(user)}.{extension}"))
+
+
+# Function to load a user's session index (metadata only)
+def load_sessions(user=None):
+    with metrics.timed("storage.seconds", op="load_sessions"), open_session_store(user) as store:
+        return store.load_index()
+
+
+# Function to get a page of a user's sessions, most recently updated first,
+# each with its date pre-formatted as 'date'; returns (sessions, total)
+def recent_sessions(user=None, limit=None, offset=0):
+    with metrics.timed("storage.seconds", op="recent_sessions"), open_session_store(user) as store:
+        return store.recent_sessions(offset, limit)
+
+
+# Function to fetch a session's messages
+def load_session_messages(session_id, user=None):
+    with metrics.timed("storage.seconds", op="load_session_messages"), open_session_store(user) as store:
+        return store.load_messages(session_id)
+
+
+# Function to save a session's metadata, and its messages when given
+def save_session(session, messages=None, user=None):
+    with metrics.timed("storage.seconds", op="save_sessions"), open_session_store(user) as store:
+        store.save_session_meta(session)
+        if messages is not None:
+            store.save_messages(session['id'], messages)
+
+
+# Function to create and store a new, empty session
+def create_session(title=None, user=None):
+    timestamp = datetime.now().isoformat()
+    session = {
+        'id': str(uuid.uuid4()),
+        'title': title if title else f"New Session {datetime.now().strftime('%b %d, %H:%M')}",
+        'created_at': timestamp,
+        'last_updated': timestamp
+    }
+    save_session(session, [], user)
+    return session
+
+
+# Function to rename a stored session; returns the updated session or None
+def rename_session(session_id, new_title, user=None):
+    session = load_sessions(user).get(session_id)
+    if session is None:
+        return None
+    session = dict(session, title=new_title)
+    save_session(session, user=user)
+    return session
+
+
+# Function to remove messages from a stored session (saving a shorter list
+# doesn't remove any, so other writers' messages are never dropped)
+def delete_messages(session_id, message_ids, user=None):
+    with metrics.timed("storage.seconds", op="delete_messages"), open_session_store(user) as store:
+        store.delete_messages(session_id, message_ids)
+
+
+# Function to remove a session from the session store
+def delete_session(session_id, user=None):
+    with metrics.timed("storage.seconds", op="delete_session"), open_session_store(user) as store:
+        store.delete_session(session_id)
+
+
+# Function to search a user's sessions by title, message text and code
+# block language; returns ranked hits (see SessionStore.search)
+def search_sessions(query, user=None, limit=SEARCH_LIMIT):
+    with metrics.timed("storage.seconds", op="search_sessions"), open_session_store(user) as store:
+        return store.search(query, limit)
+
+
+# Function to build a chat message
+def new_message(role, content, created=None):
+    return Message.create(role, content, created)
+
+
+# Function to get the rolling summary of older turns for a session
+def load_summary(session_id, user=None):
+    try:
+        with open_session_store(user) as store:
+            text, upto_id = store.load_summary(session_id)
+    except Exception:
+        text, upto_id = None, None
+    return {'session_id': session_id, 'text': text, 'upto_id': upto_id}
+
+
+# Function to store an updated rolling summary
+def save_summary(summary, user=None):
+    with metrics.timed("storage.seconds", op="save_summary"), open_session_store(user) as store:
+        store.save_summary(summary['session_id'], summary['text'], summary['upto_id'])
+
+
+# Function to count the messages a summary covers (0 if they were deleted)
+def summary_coverage(summary, history):
+    if summary['text'] and summary['upto_id']:
+        for idx in range(len(history) - 1, -1, -1):
+            if history[idx]['id'] == summary['upto_id']:
+                return idx + 1
+    return 0
+
+
+# Function to find the turns that no longer fit the context budget and are
+# not yet summarized. Returns (covered, start): history[covered:start] needs
+# summarizing, or start <= covered if nothing does.
+def summary_backlog(summary, history, budget=CONTEXT_TOKEN_BUDGET):
+    return summary_coverage(summary, history), context.recent_turns_start(history, budget)
+
+
+# Function to summarize the turns that no longer fit the context budget;
+# returns the new summary, or None if there was nothing to summarize or the
+# model call failed
+def update_summary(summary, history, budget=CONTEXT_TOKEN_BUDGET):
+    covered, start = summary_backlog(summary, history, budget)
+    if start <= covered:
+        return None
+    text = summarize_turns(summary['text'] if covered else None, history[covered:start])
+    if not text:
+        return None
+    return {'session_id': summary['session_id'], 'text': text, 'upto_id': history[start - 1]['id']}
+
+
+# Function to build the conversation context sent with a request
+def build_request_context(history, summary=None, budget=CONTEXT_TOKEN_BUDGET):
+    if not history:
+        return ""
+    summary_text = summary['text'] if summary and summary_coverage(summary, history) else None
+    context_text, context_tokens = context.build_context(history, summary_text, budget)
+    metrics.record("generate_code.context_tokens", context_tokens)
+    return context_text
+
+
+# Function to answer a prompt given the prior turns of a conversation.
+# Returns the response text; non-code prompts get NON_CODE_RESPONSE.
+def respond(prompt, history=(), summary=None, use_cache=True, template=None):
+    history = list(history)
+    if not wants_code(prompt, history):
+        return NON_CODE_RESPONSE
+    context_text = build_request_context(history, summary)
+    return generate_code(prompt, use_cache=use_cache, context_text=context_text, template=template)
+
+
+# Function to send a prompt in a stored session: the user message and the
+# response are appended and saved, and the rolling summary is updated in the
+# background. Returns the assistant message.
+def chat(session_id, prompt, use_cache=True, template=None, user=None):
+    session = load_sessions(user).get(session_id)
+    if session is None:
+        raise KeyError(session_id)
+
+    history = load_session_messages(session_id, user)
+    summary = load_summary(session_id, user)
+    user_message = new_message('user', prompt)
+    try:
+        content = respond(prompt, history, summary, use_cache=use_cache, template=template)
+    except Exception as e:
+        content = f"Error generating code: {str(e)}"
+    assistant_message = new_message('assistant', content, user_message.created)
+
+    messages = history + [user_message, assistant_message]
+    save_session(dict(session, last_updated=datetime.now().isoformat()), messages, user)
+    background.submit(refresh_summary, summary, messages, user)
+    return assistant_message
+
+
+# Function to update and store a session's rolling summary once turns no
+# longer fit the context budget; returns the new summary, or None if it
+# didn't change
+def refresh_summary(summary, messages, user=None):
+    updated = update_summary(summary, messages)
+    if updated:
+        save_summary(updated, user)
+    return updated
+
+
+# Function to get the code blocks of a response as (language, code) pairs
+def code_blocks(text):
+    return [(segment.language, segment.text) for segment in extract_code_blocks(text) if segment.is_code]
@@ -0,0 +1,135 @@
+import asyncio
+import os
+import random
+import threading
+import time
+
+from context import estimate_tokens
+
+# Canned code returned when no response text is configured
+DEFAULT_RESPONSE = """```python
+def solve(values):
+    # Return the values in sorted order
+    return sorted(values)
+
+
+if __name__ == "__main__":
+    print(solve([3, 1, 2]))
+```
+"""
+
+
+# Function to read fake model settings from the environment, so offline
+# runs (e.g. load tests) can set latency, token rate, error rate and seed
+def settings_from_env():
+    settings = {
+        'latency': float(os.getenv("CODECRAFT_FAKE_LATENCY", "0.05")),
+        'tokens_per_second': float(os.getenv("CODECRAFT_FAKE_TOKENS_PER_SECOND", "500")),
+        'error_rate': float(os.getenv("CODECRAFT_FAKE_ERROR_RATE", "0")),
+        'seed': int(os.getenv("CODECRAFT_FAKE_SEED", "0"))
+    }
+    response_file = os.getenv("CODECRAFT_FAKE_RESPONSE_FILE")
+    if response_file:
+        with open(response_file) as f:
+            settings['response_text'] = f.read()
+    return settings
+
+
+# Error raised by the fake model; named and coded like the SDK's 503 so the
+# client treats it as retryable
+class ServiceUnavailable(Exception):
+    code = 503
+
+
+# Token counts reported by the fake model, mirroring usage_metadata
+class FakeUsage:
+    def __init__(self, prompt_token_count, candidates_token_count):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.total_token_count = prompt_token_count + candidates_token_count
+
+
+class FakeResponse:
+    def __init__(self, text, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+# Async iterable of response chunks, as returned for stream=True
+class FakeAsyncStream:
+    def __init__(self, chunks, delay):
+        self._chunks = chunks
+        self._delay = delay
+
+    async def __aiter__(self):
+        for chunk in self._chunks:
+            await asyncio.sleep(self._delay)
+            yield chunk
+
+
+# Offline stand-in for genai.GenerativeModel with configurable latency,
+# token rate and error rate. Runs are deterministic for a given seed.
+class FakeModel:
+    def __init__(self, model_name="fake-model", latency=0.05, tokens_per_second=500.0,
+                 error_rate=0.0, response_text=None, chunk_tokens=8, seed=0):
+        self.model_name = model_name
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.response_text = response_text
+        self.chunk_tokens = chunk_tokens
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _next_call(self, prompt):
+        with self._lock:
+            self.calls += 1
+            fail = self._random.random() < self.error_rate
+        if fail:
+            raise ServiceUnavailable("fake model unavailable")
+        text = self.response_text if self.response_text is not None else DEFAULT_RESPONSE
+        return text, self._usage(prompt, text)
+
+    def _usage(self, prompt, text):
+        return FakeUsage(estimate_tokens(str(prompt)), estimate_tokens(text))
+
+    # Split text into chunks of roughly chunk_tokens whitespace-separated tokens
+    def _chunks(self, text, usage):
+        words = text.split(" ")
+        chunks = []
+        for i in range(0, len(words), self.chunk_tokens):
+            piece = " ".join(words[i:i + self.chunk_tokens])
+            if i + self.chunk_tokens < len(words):
+                piece += " "
+            chunks.append(FakeResponse(piece, usage))
+        return chunks
+
+    def _generation_time(self, usage):
+        return usage.candidates_token_count / self.tokens_per_second
+
+    def generate_content(self, prompt, generation_config=None, safety_settings=None, stream=False):
+        time.sleep(self.latency)
+        text, usage = self._next_call(prompt)
+        if stream:
+            chunks = self._chunks(text, usage)
+            delay = self._generation_time(usage) / max(len(chunks), 1)
+
+            def iterate():
+                for chunk in chunks:
+                    time.sleep(delay)
+                    yield chunk
+            return iterate()
+        time.sleep(self._generation_time(usage))
+        return FakeResponse(text, usage)
+
+    async def generate_content_async(self, prompt, generation_config=None, safety_settings=None,
+                                     stream=False):
+        await asyncio.sleep(self.latency)
+        text, usage = self._next_call(prompt)
+        if stream:
+            chunks = self._chunks(text, usage)
+            return FakeAsyncStream(chunks, self._generation_time(usage) / max(len(chunks), 1))
+        await asyncio.sleep(self._generation_time(usage))
+        return FakeResponse(text, usage)
+
@@ -0,0 +1,367 @@
+import asyncio
+import random
+import threading
+import time
+from contextlib import aclosing
+
+import metrics
+
+# Per-call deadline in seconds, covering the limiter wait, every attempt and
+# the backoff between them
+DEFAULT_TIMEOUT = 60.0
+
+# Retries after the first attempt for retryable errors
+MAX_RETRIES = 3
+
+# Exponential backoff bounds in seconds (full jitter is applied)
+BASE_BACKOFF = 0.5
+MAX_BACKOFF = 8.0
+
+# Model calls allowed in flight at once across every user of the process
+MAX_CONCURRENT_CALLS = 8
+
+# Consecutive failed calls that open the circuit, and how long it stays open
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 30.0
+
+# HTTP status codes and exception names that are worth retrying
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+RETRYABLE_NAMES = {
+    'ResourceExhausted', 'TooManyRequests', 'InternalServerError', 'ServiceUnavailable',
+    'BadGateway', 'GatewayTimeout', 'DeadlineExceeded', 'ModelTimeoutError'
+}
+
+
+# Raised when a model call does not finish before its deadline
+class ModelTimeoutError(Exception):
+    pass
+
+
+# Raised without calling the model while the circuit breaker is open
+class CircuitOpenError(Exception):
+    pass
+
+
+# Function to decide whether an error from the model is transient
+def is_retryable(error):
+    code = getattr(error, 'code', None)
+    if isinstance(code, int) and code in RETRYABLE_STATUS:
+        return True
+    return type(error).__name__ in RETRYABLE_NAMES
+
+
+# Function to decide whether an error means the rate limit was hit
+def is_rate_limited(error):
+    return getattr(error, 'code', None) == 429 or type(error).__name__ in ('ResourceExhausted', 'TooManyRequests')
+
+
+# Function to compute a jittered exponential backoff delay for an attempt
+def backoff_delay(attempt, base=BASE_BACKOFF, cap=MAX_BACKOFF):
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+# Function to get the absolute deadline for a call: the given one, or
+# timeout seconds (DEFAULT_TIMEOUT if not given) from now
+def call_deadline(timeout=None, deadline=None):
+    if deadline is not None:
+        return deadline
+    return time.monotonic() + (timeout or DEFAULT_TIMEOUT)
+
+
+# Function to get the seconds left before a deadline; raises
+# ModelTimeoutError once it has passed
+def time_left(deadline, start):
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise timeout_error(start)
+    return left
+
+
+# Function to build the error for a call that started at start and ran out
+# of time
+def timeout_error(start):
+    return ModelTimeoutError(f"Model call timed out after {time.monotonic() - start:.1f}s")
+
+
+# Concurrency limiter for the calls on the shared event loop; waiters are
+# woken as slots free up instead of polling
+class ConcurrencyLimiter:
+    def __init__(self, limit=MAX_CONCURRENT_CALLS):
+        self.limit = limit
+        self._semaphore = asyncio.BoundedSemaphore(limit)
+
+    async def acquire(self):
+        await self._semaphore.acquire()
+
+    def release(self):
+        self._semaphore.release()
+
+
+# Circuit breaker: after too many consecutive failures, calls fail fast until
+# the cooldown passes, then a single trial call decides whether to close it
+class CircuitBreaker:
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.state = "closed"
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            # Only the first caller after the cooldown gets through
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.cooldown:
+                self.state = "half-open"
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.state = "closed"
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half-open" or self.failures >= self.threshold:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+    # Function to reopen the circuit when the trial call ended without an
+    # outcome (e.g. it timed out waiting for the limiter, or its stream was
+    # closed early); otherwise it would stay half-open and refuse every call
+    def end_trial(self):
+        with self._lock:
+            if self.state == "half-open":
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+
+# Function to record the token counts a response reports in usage_metadata
+def record_usage(usage, **labels):
+    if usage is None:
+        return
+    metrics.record("model_call.input_tokens", getattr(usage, 'prompt_token_count', 0) or 0, **labels)
+    metrics.record("model_call.output_tokens", getattr(usage, 'candidates_token_count', 0) or 0, **labels)
+
+
+# Async wrapper around a GenerativeModel (or a fake with the same methods).
+# Every call records its wall time, token usage, retries and errors in
+# metrics, labelled with the client name.
+class GeminiClient:
+    def __init__(self, model, timeout=DEFAULT_TIMEOUT, max_retries=MAX_RETRIES,
+                 limiter=None, breaker=None, name=None):
+        self.model = model
+        self.name = name or getattr(model, 'model_name', 'model')
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.limiter = limiter or _limiter
+        self.breaker = breaker or CircuitBreaker()
+        self.retries = 0
+
+    # Generate a full response with deadline, retries and the circuit breaker.
+    # The deadline (timeout seconds from now unless an absolute monotonic
+    # deadline is given) bounds the whole call, retries included.
+    async def generate(self, prompt, timeout=None, deadline=None, **kwargs):
+        with metrics.timed("model_call.seconds", model=self.name, method="generate"):
+            response = await self._generate(prompt, call_deadline(timeout or self.timeout, deadline), **kwargs)
+        record_usage(getattr(response, 'usage_metadata', None), model=self.name)
+        return response
+
+    async def _generate(self, prompt, deadline, **kwargs):
+        start = time.monotonic()
+        trial = self._allow()
+        try:
+            attempt = 0
+            while True:
+                await self._acquire(deadline, start)
+                try:
+                    response = await asyncio.wait_for(
+                        self.model.generate_content_async(prompt, **kwargs), time_left(deadline, start))
+                except asyncio.TimeoutError:
+                    error = timeout_error(start)
+                except Exception as e:
+                    error = e
+                else:
+                    self.breaker.record_success()
+                    return response
+                finally:
+                    self.limiter.release()
+
+                attempt = await self._retry(error, attempt, deadline)
+        finally:
+            if trial:
+                self.breaker.end_trial()
+
+    # Stream response text chunks; retries only happen before the first chunk
+    # since a partial answer can't be replayed
+    async def stream(self, prompt, timeout=None, deadline=None, **kwargs):
+        start = time.perf_counter()
+        first_chunk = True
+        usage = []
+        # aclosing() passes an early close on to _stream, so it releases
+        # its limiter slot and ends a breaker trial right away
+        with metrics.timed("model_call.seconds", model=self.name, method="stream"):
+            async with aclosing(self._stream(prompt, call_deadline(timeout or self.timeout, deadline), usage,
+                                             **kwargs)) as chunks:
+                async for text in chunks:
+                    if first_chunk:
+                        metrics.record("model_call.time_to_first_token", time.perf_counter() - start,
+                                       model=self.name)
+                        first_chunk = False
+                    yield text
+        record_usage(usage[-1] if usage else None, model=self.name)
+
+    # usage collects the usage_metadata reported by the chunks
+    async def _stream(self, prompt, deadline, usage, **kwargs):
+        start = time.monotonic()
+        trial = self._allow()
+        try:
+            attempt = 0
+            while True:
+                await self._acquire(deadline, start)
+                received = False
+                try:
+                    response = await asyncio.wait_for(
+                        self.model.generate_content_async(prompt, stream=True, **kwargs),
+                        time_left(deadline, start))
+                    chunks = response.__aiter__()
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(chunks.__anext__(), time_left(deadline, start))
+                        except StopAsyncIteration:
+                            break
+                        received = True
+                        if getattr(chunk, 'usage_metadata', None) is not None:
+                            usage.append(chunk.usage_metadata)
+                        if chunk.text:
+                            yield chunk.text
+                except asyncio.TimeoutError:
+                    error = timeout_error(start)
+                except Exception as e:
+                    error = e
+                else:
+                    self.breaker.record_success()
+                    return
+                finally:
+                    self.limiter.release()
+
+                if received:
+                    self.breaker.record_failure()
+                    raise error
+                attempt = await self._retry(error, attempt, deadline)
+        finally:
+            # Also runs when the caller stops reading or the task is cancelled
+            if trial:
+                self.breaker.end_trial()
+
+    # Check the circuit breaker before a call; returns whether the call is
+    # the half-open trial, which must end with an outcome
+    def _allow(self):
+        if not self.breaker.allow():
+            raise CircuitOpenError("Model temporarily unavailable after repeated failures")
+        return self.breaker.state == "half-open"
+
+    # Wait for a limiter slot; the wait counts against the deadline
+    async def _acquire(self, deadline, start):
+        try:
+            await asyncio.wait_for(self.limiter.acquire(), time_left(deadline, start))
+        except asyncio.TimeoutError:
+            raise timeout_error(start) from None
+
+    # Back off before the next attempt, or raise the error if it isn't worth
+    # retrying or the deadline would pass before the next attempt starts;
+    # returns the next attempt number
+    async def _retry(self, error, attempt, deadline):
+        if not self._should_retry(error, attempt):
+            raise error
+        attempt += 1
+        delay = backoff_delay(attempt)
+        if time.monotonic() + delay >= deadline:
+            self.breaker.record_failure()
+            raise error
+        self._record_retry()
+        await asyncio.sleep(delay)
+        return attempt
+
+    def _record_retry(self):
+        self.retries += 1
+        metrics.increment("model_call.retries", model=self.name)
+
+    # Blocking versions for callers that are not running an event loop
+    def generate_sync(self, prompt, timeout=None, deadline=None, **kwargs):
+        return run_sync(self.generate(prompt, timeout=timeout, deadline=deadline, **kwargs))
+
+    def stream_sync(self, prompt, timeout=None, deadline=None, **kwargs):
+        return iterate_sync(self.stream(prompt, timeout=timeout, deadline=deadline, **kwargs))
+
+    # Run a blocking SDK call (e.g. list_models) with a deadline
+    def call_sync(self, fn, timeout=None):
+        async def call():
+            loop = asyncio.get_running_loop()
+            return await asyncio.wait_for(loop.run_in_executor(None, fn), timeout or self.timeout)
+        with metrics.timed("model_call.seconds", model=self.name, method="call"):
+            return run_sync(call())
+
+    # Non-retryable errors (e.g. a bad request) mean the service answered, so
+    # they don't count against the circuit breaker
+    def _should_retry(self, error, attempt):
+        if not is_retryable(error):
+            self.breaker.record_success()
+            return False
+        if attempt < self.max_retries:
+            return True
+        self.breaker.record_failure()
+        return False
+
+
+# Every model call in the process shares one limiter and one event loop, so
+# the SDK's async transport is created once and reused
+_limiter = ConcurrencyLimiter()
+_loop = None
+_loop_lock = threading.Lock()
+_clients = {}
+
+
+# Function to get the background event loop, starting it on first use
+def get_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="codecraft-model-loop", daemon=True).start()
+        return _loop
+
+
+# Function to run a coroutine on the shared loop and wait for its result
+def run_sync(coro):
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result()
+
+
+# Function to consume an async generator from synchronous code; closing the
+# iterator early closes the async generator too, so its cleanup (limiter
+# slot, circuit breaker trial) runs right away instead of when collected
+def iterate_sync(agen):
+    loop = get_loop()
+    try:
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(agen.__anext__(), loop).result()
+            except StopAsyncIteration:
+                return
+    finally:
+        asyncio.run_coroutine_threadsafe(agen.aclose(), loop).result()
+
+
+# Function to get the process-wide client for a name, creating the model
+# with create_model() the first time
+def get_client(name, create_model):
+    with _loop_lock:
+        client = _clients.get(name)
+        if client is None:
+            client = GeminiClient(create_model(), name=name)
+            _clients[name] = client
+        return client
@@ -0,0 +1,159 @@
+import json
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+# Number of recent samples kept per metric
+MAX_SAMPLES = 1000
+
+# Percentiles reported for every sampled metric
+PERCENTILES = (50, 95, 99)
+
+# Prefix for exported Prometheus metric names
+PROMETHEUS_PREFIX = "codecraft_"
+
+# Metrics are shared by every session in the server process. Samples and
+# counters are keyed by (name, labels) where labels is a sorted tuple of
+# (label, value) pairs. Percentiles come from the recent samples; the
+# running count and sum of every sample ever recorded are kept apart, so
+# they only ever grow.
+_samples = defaultdict(lambda: deque(maxlen=MAX_SAMPLES))
+_totals = defaultdict(lambda: [0, 0.0])
+_counters = defaultdict(float)
+_lock = threading.Lock()
+
+
+def _key(name, labels):
+    return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+
+# Function to record a single measurement (e.g. seconds or token counts)
+def record(name, value, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _samples[key].append(value)
+        totals = _totals[key]
+        totals[0] += 1
+        totals[1] += value
+
+
+# Function to add to a counter (e.g. cache hits or retries)
+def increment(name, amount=1, **labels):
+    with _lock:
+        _counters[_key(name, labels)] += amount
+
+
+# Function to record the wall time of a block in seconds; failures are
+# counted in <name>.errors
+@contextmanager
+def timed(name, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        increment(f"{name}.errors", **labels)
+        raise
+    finally:
+        record(name, time.perf_counter() - start, **labels)
+
+
+# Function to get the value at a percentile of sorted values (nearest rank)
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * q // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def _summarize(values):
+    if not values:
+        return {'count': 0}
+    ordered = sorted(values)
+    result = {
+        'count': len(values),
+        'last': values[-1],
+        'mean': sum(values) / len(values),
+        'max': ordered[-1]
+    }
+    for q in PERCENTILES:
+        result[f'p{q}'] = percentile(ordered, q)
+    return result
+
+
+# Function to get a summary of the recorded samples for a metric
+def summary(name, **labels):
+    with _lock:
+        values = list(_samples.get(_key(name, labels), ()))
+    return _summarize(values)
+
+
+# Function to get a counter's value
+def counter(name, **labels):
+    with _lock:
+        return _counters.get(_key(name, labels), 0)
+
+
+# Function to get every metric as a list of dicts: sampled metrics with their
+# summaries of the recent samples and running totals ('total_count',
+# 'total_sum'), then counters with their values
+def snapshot():
+    with _lock:
+        samples = [(key, list(values), tuple(_totals[key])) for key, values in _samples.items()]
+        counters = list(_counters.items())
+    rows = []
+    for (name, labels), values, (total_count, total_sum) in sorted(samples, key=lambda sample: sample[0]):
+        rows.append(dict(name=name, labels=dict(labels), type='summary', **_summarize(values),
+                         total_count=total_count, total_sum=total_sum))
+    for (name, labels), value in sorted(counters):
+        rows.append({'name': name, 'labels': dict(labels), 'type': 'counter', 'value': value})
+    return rows
+
+
+def _prometheus_name(name):
+    return PROMETHEUS_PREFIX + re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+def _prometheus_labels(labels, **extra):
+    labels = dict(labels, **extra)
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(label, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for label, value in sorted(labels.items())
+    )
+    return "{" + pairs + "}"
+
+
+# Function to export every metric in the Prometheus text format
+def export_prometheus():
+    lines = []
+    typed = set()
+    for row in snapshot():
+        name = _prometheus_name(row['name'])
+        if row['type'] == 'counter':
+            name += "_total"
+        if name not in typed:
+            lines.append(f"# TYPE {name} {row['type']}")
+            typed.add(name)
+        if row['type'] == 'counter':
+            lines.append(f"{name}{_prometheus_labels(row['labels'])} {row['value']:g}")
+            continue
+        for q in PERCENTILES:
+            lines.append(f"{name}{_prometheus_labels(row['labels'], quantile=q / 100)} {row[f'p{q}']:g}")
+        lines.append(f"{name}_sum{_prometheus_labels(row['labels'])} {row['total_sum']:g}")
+        lines.append(f"{name}_count{_prometheus_labels(row['labels'])} {row['total_count']}")
+    return "\n".join(lines) + "\n"
+
+
+# Function to export every metric as JSON lines stamped with the current time
+def export_jsonl():
+    timestamp = time.time()
+    return "".join(json.dumps(dict(row, timestamp=timestamp)) + "\n" for row in snapshot())
+
+
+# Function to append a snapshot of every metric to a JSONL log file
+def write_jsonl(path):
+    with open(path, "a") as f:
+        f.write(export_jsonl())
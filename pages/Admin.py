@@ -0,0 +1,62 @@
+import streamlit as st
+
+import metrics
+from router import get_router
+
+st.set_page_config(
+    page_title="CodeCraft AI - Admin",
+    page_icon="🧩",
+    layout="wide",
+)
+
+st.title("Metrics")
+st.caption(f"Percentiles over the last {metrics.MAX_SAMPLES} samples of each metric in this server process")
+
+rows = metrics.snapshot()
+summaries = [row for row in rows if row['type'] == 'summary']
+counters = [row for row in rows if row['type'] == 'counter']
+
+# Function to format a metric's labels for display
+def format_labels(labels):
+    return ", ".join(f"{label}={value}" for label, value in labels.items())
+
+st.subheader("Latency and tokens")
+if summaries:
+    st.dataframe([
+        {
+            'metric': row['name'],
+            'labels': format_labels(row['labels']),
+            'count': row['count'],
+            'p50': row['p50'],
+            'p95': row['p95'],
+            'p99': row['p99'],
+            'max': row['max']
+        }
+        for row in summaries
+    ], use_container_width=True)
+else:
+    st.info("No samples recorded yet.")
+
+st.subheader("Counters")
+if counters:
+    st.dataframe([
+        {'metric': row['name'], 'labels': format_labels(row['labels']), 'value': row['value']}
+        for row in counters
+    ], use_container_width=True)
+else:
+    st.info("No counters recorded yet.")
+
+st.subheader("Model routing")
+routing = get_router().snapshot()
+if routing:
+    st.dataframe([dict(model=name, **stats) for name, stats in routing.items()], use_container_width=True)
+else:
+    st.info("No model calls yet.")
+
+col1, col2 = st.columns(2)
+with col1:
+    st.download_button("Download Prometheus text", metrics.export_prometheus(),
+                       file_name="codecraft_metrics.prom", mime="text/plain")
+with col2:
+    st.download_button("Download JSONL", metrics.export_jsonl(),
+                       file_name="codecraft_metrics.jsonl", mime="application/json")
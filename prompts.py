@@ -0,0 +1,77 @@
+from collections import namedtuple
+
+from context import estimate_tokens
+
+# A named, versioned prompt. The static instructions are sent once per model
+# instance as the system instruction; only the request part is sent per call.
+PromptTemplate = namedtuple('PromptTemplate', ['name', 'version', 'system_instruction', 'request', 'generation_config'])
+
+COMPACT_INSTRUCTION = """You are CodeCraft AI, an expert software engineer that only generates code.
+Reply with complete, working, idiomatic code in fenced code blocks tagged with the language.
+Keep any prose to at most two short sentences and do not restate the request.
+Only comment code where it is not self-explanatory.
+When earlier conversation is provided, apply the request to that code."""
+
+EXPLAINED_INSTRUCTION = """You are CodeCraft AI, an elite-level programmer that ONLY generates code, never explanations or theory.
+You have been writing optimized, scalable, and clean code in multiple languages for over 20 years and are deeply familiar with performance tuning, code modularity, algorithm efficiency, and best practices in documentation.
+For each request:
+Step 1: Break down the problem into logical components and state what the output should accomplish.
+Step 2: Propose an architectural or algorithmic approach. Highlight any important trade-offs, edge cases, or assumptions.
+Step 3: Write clean, optimized, and well-documented code to implement the solution, in fenced code blocks tagged with the language.
+Use detailed comments to explain what each part does.
+When earlier conversation is provided, apply the request to that code."""
+
+REQUEST = "{conversation}Request:\n{prompt}"
+
+TEMPLATES = {
+    'code-only-compact': PromptTemplate(
+        name='code-only-compact',
+        version=1,
+        system_instruction=COMPACT_INSTRUCTION,
+        request=REQUEST,
+        generation_config={
+            "temperature": 0.4,
+            "top_p": 0.95,
+            "top_k": 64,
+            "max_output_tokens": 4096,
+        }
+    ),
+    'explained': PromptTemplate(
+        name='explained',
+        version=1,
+        system_instruction=EXPLAINED_INSTRUCTION,
+        request=REQUEST,
+        generation_config={
+            "temperature": 0.7,
+            "top_p": 0.95,
+            "top_k": 64,
+            "max_output_tokens": 8192,
+        }
+    ),
+}
+
+DEFAULT_TEMPLATE = 'code-only-compact'
+
+
+# Function to look up a template by name, falling back to the default
+def get_template(name=None):
+    return TEMPLATES.get(name) or TEMPLATES[DEFAULT_TEMPLATE]
+
+
+# Function to get the identifier used in cache keys and model names
+def template_id(template):
+    return f"{template.name}@v{template.version}"
+
+
+# Function to render the per-request part of a template
+def render_request(template, prompt, context_text=""):
+    conversation = f"Conversation so far (for reference):\n{context_text}\n\n" if context_text else ""
+    return template.request.format(conversation=conversation, prompt=prompt)
+
+
+# Function to measure a template's static and per-request input tokens
+def measure_template(template, prompt, count_tokens=estimate_tokens):
+    return {
+        'system_tokens': count_tokens(template.system_instruction),
+        'request_tokens': count_tokens(render_request(template, prompt))
+    }
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+# Entries older than this are treated as misses (seconds)
+DEFAULT_TTL = 7 * 24 * 3600
+
+# Maximum number of cached responses before least recently used ones are evicted
+MAX_ENTRIES = 5000
+
+
+# Function to normalize a prompt so prompts that only differ in whitespace
+# share an entry; case and punctuation can change the answer, so they are kept
+def normalize_prompt(prompt):
+    return " ".join(prompt.split())
+
+
+# Function to build the cache key for a prompt, model and generation config
+def make_key(prompt, model_name, generation_config, **extra):
+    payload = json.dumps({
+        'prompt': normalize_prompt(prompt),
+        'model': model_name,
+        'config': generation_config,
+        'extra': extra
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+# Persistent response cache backed by SQLite with TTL and LRU eviction
+class ResponseCache:
+    def __init__(self, path, ttl=DEFAULT_TTL, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+
+    # Return the cached response for a key, or None on a miss
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, response):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, created_at, last_access) "
+                "VALUES (?, ?, ?, ?)", (key, response, now, now))
+            self._evict(now)
+
+    # Drop expired entries, then the least recently used ones over the limit
+    def _evict(self, now):
+        expired = self._conn.execute(
+            "DELETE FROM responses WHERE created_at < ?", (now - self.ttl,)).rowcount
+        count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY last_access LIMIT ?)", (overflow,))
+        self.evictions += expired + max(overflow, 0)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {
+            'entries': entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+
+# Caches are kept per process so reruns reuse the open connection
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+# Function to get (or open) the response cache at a path
+def get_cache(path):
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            cache = ResponseCache(path)
+            _caches[path] = cache
+        return cache
@@ -0,0 +1,179 @@
+import threading
+import time
+
+# Task types the router knows about
+TASK_TITLE = "title"
+TASK_SUMMARY = "summary"
+TASK_SNIPPET = "snippet"
+TASK_LARGE = "large"
+
+# Models to try for each task, in order of preference; later entries are
+# fallbacks when earlier ones fail or are unhealthy
+ROUTES = {
+    TASK_TITLE: ('gemini-1.5-flash-8b', 'gemini-1.5-flash'),
+    TASK_SUMMARY: ('gemini-1.5-flash-8b', 'gemini-1.5-flash'),
+    TASK_SNIPPET: ('gemini-1.5-flash', 'gemini-1.5-flash-8b'),
+    TASK_LARGE: ('gemini-1.5-flash', 'gemini-1.5-pro'),
+}
+
+# Generation config overrides applied per task
+TASK_CONFIG = {
+    TASK_TITLE: {"temperature": 0.2, "top_p": 0.95, "top_k": 32, "max_output_tokens": 20},
+    TASK_SUMMARY: {"temperature": 0.2, "max_output_tokens": 300},
+    TASK_SNIPPET: {},
+    TASK_LARGE: {},
+}
+
+# Requests with at least this many input tokens, or allowing more than this
+# many output tokens, count as large generations
+LARGE_PROMPT_TOKENS = 1500
+SNIPPET_MAX_OUTPUT_TOKENS = 4096
+
+# Weight of the newest sample in the moving averages
+EWMA_ALPHA = 0.2
+
+# Models whose recent error rate is above this are tried last, until
+# RETRY_AFTER seconds have passed since their last failure
+MAX_ERROR_RATE = 0.5
+RETRY_AFTER = 30
+
+# Healthy models whose average latency is more than this many times that of
+# the fastest healthy model in the route are tried after the others
+SLOW_LATENCY_FACTOR = 3
+
+
+# Moving averages of latency and error rate for one model
+class ModelStats:
+    def __init__(self):
+        self.latency = None
+        self.error_rate = 0.0
+        self.calls = 0
+        self.failures = 0
+        self.last_failure = None
+
+    def record(self, seconds, ok):
+        self.calls += 1
+        if ok:
+            self.latency = seconds if self.latency is None else \
+                EWMA_ALPHA * seconds + (1 - EWMA_ALPHA) * self.latency
+        else:
+            self.failures += 1
+            self.last_failure = time.monotonic()
+        self.error_rate = EWMA_ALPHA * (0.0 if ok else 1.0) + (1 - EWMA_ALPHA) * self.error_rate
+
+
+# Picks a model and generation config per task and falls back to the next
+# model in the route when a call fails
+class ModelRouter:
+    def __init__(self, routes=ROUTES):
+        self.routes = routes
+        self.stats = {}
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+
+    # Function to choose between a snippet and a large generation
+    def code_task(self, input_tokens, max_output_tokens=0):
+        if input_tokens >= LARGE_PROMPT_TOKENS or max_output_tokens > SNIPPET_MAX_OUTPUT_TOKENS:
+            return TASK_LARGE
+        return TASK_SNIPPET
+
+    # Function to merge a task's overrides into a base generation config
+    def generation_config(self, task, base=None):
+        config = dict(base or {})
+        config.update(TASK_CONFIG.get(task, {}))
+        return config
+
+    def primary(self, task):
+        return self.routes[task][0]
+
+    # Models for a task in the order to try them: healthy models keep their
+    # configured order unless they are much slower than another healthy model,
+    # models that failed often and recently go last
+    def candidates(self, task):
+        with self._lock:
+            healthy = [name for name in self.routes[task] if not self._unhealthy(name)]
+            latencies = [self.stats[name].latency for name in healthy
+                         if name in self.stats and self.stats[name].latency is not None]
+            fastest = min(latencies) if latencies else None
+            return sorted(self.routes[task],
+                          key=lambda name: (self._unhealthy(name), self._slow(name, fastest)))
+
+    def record(self, model_name, seconds, ok):
+        with self._lock:
+            self.stats.setdefault(model_name, ModelStats()).record(seconds, ok)
+
+    def _unhealthy(self, model_name):
+        stats = self.stats.get(model_name)
+        return bool(stats) and stats.error_rate > MAX_ERROR_RATE and \
+            time.monotonic() - stats.last_failure < RETRY_AFTER
+
+    def _slow(self, model_name, fastest):
+        stats = self.stats.get(model_name)
+        return fastest is not None and bool(stats) and stats.latency is not None and \
+            stats.latency > SLOW_LATENCY_FACTOR * fastest
+
+    # Function to run call(model_name) on each candidate until one succeeds;
+    # with a deadline (time.monotonic() based), no fallback starts after it
+    def call(self, task, call, deadline=None):
+        error = None
+        for attempt, model_name in enumerate(self.candidates(task)):
+            if attempt and deadline is not None and time.monotonic() >= deadline:
+                break
+            if attempt:
+                self.fallbacks += 1
+            start = time.perf_counter()
+            try:
+                result = call(model_name)
+            except Exception as e:
+                self.record(model_name, time.perf_counter() - start, False)
+                error = e
+                continue
+            self.record(model_name, time.perf_counter() - start, True)
+            return result
+        raise error
+
+    # Function to stream from each candidate until one produces output; once
+    # a chunk has been yielded, errors are raised instead of falling back
+    def stream(self, task, stream, deadline=None):
+        error = None
+        for attempt, model_name in enumerate(self.candidates(task)):
+            if attempt and deadline is not None and time.monotonic() >= deadline:
+                break
+            if attempt:
+                self.fallbacks += 1
+            start = time.perf_counter()
+            received = False
+            try:
+                for chunk in stream(model_name):
+                    received = True
+                    yield chunk
+            except Exception as e:
+                self.record(model_name, time.perf_counter() - start, False)
+                if received:
+                    raise
+                error = e
+                continue
+            self.record(model_name, time.perf_counter() - start, True)
+            return
+        raise error
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                name: {
+                    'calls': stats.calls,
+                    'failures': stats.failures,
+                    'latency': stats.latency,
+                    'error_rate': stats.error_rate
+                }
+                for name, stats in self.stats.items()
+            }
+
+
+# One router per process so stats are shared by every session
+_router = ModelRouter()
+
+
+# Function to get the process-wide router
+def get_router():
+    return _router
@@ -0,0 +1,962 @@
+import itertools
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import zlib
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+
+from chat_message import Message, Role
+from code_blocks import extract_code_blocks
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+# Number of writes between automatic compaction passes
+COMPACT_EVERY = 500
+
+# How long a SQLite write waits for another process's write to finish
+BUSY_TIMEOUT = 30.0
+
+# Function to split a SQL script into statements (trigger bodies contain
+# semicolons, so a plain split isn't enough)
+def split_statements(script):
+    statements = []
+    current = ""
+    for part in script.split(";"):
+        current += part + ";"
+        if sqlite3.complete_statement(current):
+            if current.strip(" \n;"):
+                statements.append(current.strip())
+            current = ""
+    return statements
+
+
+# Function to get the code block languages of a message as a
+# space-separated string, indexed for search
+def message_languages(content):
+    if "```" not in content and "~~~" not in content:
+        return ""
+    languages = {segment.language.lower() for segment in extract_code_blocks(content)
+                 if segment.is_code and segment.language}
+    return " ".join(sorted(languages))
+
+
+# Function to fill in the code block languages of messages stored before
+# they were recorded; the update trigger indexes them as it goes
+def backfill_message_languages(conn):
+    rows = conn.execute(
+        "SELECT rowid, content FROM messages WHERE content LIKE '%```%' OR content LIKE '%~~~%'").fetchall()
+    conn.executemany(
+        "UPDATE messages SET languages = ? WHERE rowid = ?",
+        [(languages, rowid) for rowid, languages in
+         ((rowid, message_languages(content)) for rowid, content in rows) if languages]
+    )
+
+
+# Message bodies are stored as one format byte followed by the text. Short
+# bodies gain nothing from compression and are kept as UTF-8; longer ones
+# are raw deflate primed with COMPRESSION_DICTIONARY, so even a single
+# response compresses well. The dictionary must never change: a new one
+# needs a new format byte.
+BODY_PLAIN = b"\x00"
+BODY_DEFLATE = b"\x01"
+MIN_COMPRESSED_SIZE = 96
+COMPRESSION_LEVEL = 6
+
+# Text common in code responses; zlib finds matches cheapest near the end
+COMPRESSION_DICTIONARY = "".join((
+    "#include <stdio.h>\n#include <stdlib.h>\nint main(int argc, char *argv[]) {\n    return 0;\n}\n",
+    "public class Main {\n    public static void main(String[] args) {\n        System.out.println(",
+    "package main\n\nimport (\n\t\"fmt\"\n)\n\nfunc main() {\n\tfmt.Println(",
+    "fn main() {\n    let mut result = Vec::new();\n    println!(\"{}\", ",
+    "SELECT * FROM WHERE ORDER BY GROUP BY INSERT INTO VALUES CREATE TABLE ",
+    "#!/bin/bash\nset -euo pipefail\necho \"$1\"\n",
+    "<!DOCTYPE html>\n<html>\n<head>\n<body>\n<div class=\"container\">\n</div>\n",
+    "const express = require('express');\nimport React, { useState, useEffect } from 'react';\n",
+    "async function fetchData(url) {\n  try {\n    const response = await fetch(url);\n",
+    "  } catch (error) {\n    console.error(error);\n  }\n}\nexport default ",
+    "function (const let var => return null; undefined true false this.",
+    "### Explanation\n\n1. **Time complexity**: O(n log n)\n2. **Space complexity**: O(n)\n",
+    "Here's a Python function that ",
+    "Here is an implementation of ",
+    "This code defines a function that takes ",
+    "## Example usage\n\n**Key points:**\n\n* ",
+    "```javascript\n```java\n```cpp\n```bash\n```sql\n```\n\n",
+    "import os\nimport sys\nimport json\nfrom typing import List, Dict, Optional\n",
+    "class Solution:\n    def __init__(self):\n        self.",
+    "    # Example usage\nif __name__ == \"__main__\":\n    main()\n",
+    "        raise ValueError(\"\n    except Exception as e:\n        print(f\"Error: {e}\")\n",
+    "    for i in range(len(\n        if not \n            return None\n        else:\n",
+    "    Args:\n    Returns:\n    \"\"\"\n    result = []\n    return result\n\n\n",
+    "```python\ndef ",
+)).encode("utf-8")
+
+
+# Function to encode a message body for storage
+def compress_text(text):
+    data = text.encode("utf-8")
+    if len(data) < MIN_COMPRESSED_SIZE:
+        return BODY_PLAIN + data
+    compressor = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, -15, zdict=COMPRESSION_DICTIONARY)
+    compressed = compressor.compress(data) + compressor.flush()
+    if len(compressed) >= len(data):
+        return BODY_PLAIN + data
+    return BODY_DEFLATE + compressed
+
+
+# Function to decode a stored message body
+def decompress_text(body):
+    body = bytes(body)
+    if body[:1] == BODY_DEFLATE:
+        return zlib.decompressobj(-15, zdict=COMPRESSION_DICTIONARY).decompress(body[1:]).decode("utf-8")
+    return body[1:].decode("utf-8")
+
+
+# Function to move messages to compact rows: integer roles, epoch times and
+# compressed bodies. Search reads message text through a view that
+# decompresses it (message_text() is registered on every connection).
+def compact_message_rows(conn):
+    for statement in split_statements("""
+        DROP TRIGGER messages_fts_insert;
+        DROP TRIGGER messages_fts_delete;
+        DROP TRIGGER messages_fts_update;
+        DROP TABLE messages_fts;
+        CREATE TABLE compact_messages (
+            session_id TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            id TEXT NOT NULL,
+            role INTEGER NOT NULL,
+            body BLOB NOT NULL,
+            created REAL,
+            languages TEXT NOT NULL DEFAULT '',
+            PRIMARY KEY (session_id, seq)
+        );
+    """):
+        conn.execute(statement)
+
+    rows = conn.execute("SELECT session_id, seq, id, role, content, timestamp, languages FROM messages ORDER BY rowid")
+    while True:
+        batch = rows.fetchmany(500)
+        if not batch:
+            break
+        compact_rows = []
+        for session_id, seq, message_id, role, content, timestamp, languages in batch:
+            message = Message.from_dict({'id': message_id, 'role': role, 'content': content, 'timestamp': timestamp})
+            compact_rows.append((session_id, seq, message.id, int(message.role), compress_text(message.content),
+                                 message.created, languages))
+        conn.executemany(
+            "INSERT INTO compact_messages (session_id, seq, id, role, body, created, languages) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)", compact_rows)
+
+    for statement in split_statements("""
+        DROP TABLE messages;
+        ALTER TABLE compact_messages RENAME TO messages;
+        CREATE VIEW message_text AS
+            SELECT rowid AS message_rowid, message_text(body) AS content, languages FROM messages;
+        CREATE VIRTUAL TABLE messages_fts USING fts5(
+            content, languages, content='message_text', content_rowid='message_rowid'
+        );
+        INSERT INTO messages_fts(messages_fts, rank) VALUES ('rank', 'bm25(1.0, 2.0)');
+        CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts(rowid, content, languages)
+            VALUES (new.rowid, message_text(new.body), new.languages);
+        END;
+        CREATE TRIGGER messages_fts_delete AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts(messages_fts, rowid, content, languages)
+            VALUES ('delete', old.rowid, message_text(old.body), old.languages);
+        END;
+        CREATE TRIGGER messages_fts_update AFTER UPDATE OF body, languages ON messages BEGIN
+            INSERT INTO messages_fts(messages_fts, rowid, content, languages)
+            VALUES ('delete', old.rowid, message_text(old.body), old.languages);
+            INSERT INTO messages_fts(rowid, content, languages)
+            VALUES (new.rowid, message_text(new.body), new.languages);
+        END;
+        INSERT INTO messages_fts(messages_fts) VALUES ('rebuild');
+    """):
+        conn.execute(statement)
+
+
+# Schema migrations, applied in order: SQL scripts, or functions taking the
+# connection. PRAGMA user_version records how many have run.
+MIGRATIONS = (
+    """
+    CREATE TABLE IF NOT EXISTS sessions (
+        id TEXT PRIMARY KEY,
+        title TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        last_updated TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS messages (
+        session_id TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        id TEXT NOT NULL,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        timestamp TEXT,
+        PRIMARY KEY (session_id, seq)
+    );
+    """,
+    """
+    ALTER TABLE sessions ADD COLUMN summary TEXT;
+    ALTER TABLE sessions ADD COLUMN summary_upto TEXT;
+    """,
+    # Full-text search over message content, code block languages and
+    # session titles. The FTS tables index the rows of messages and sessions
+    # without storing a second copy; triggers keep them in step with every
+    # insert, update and delete.
+    """
+    ALTER TABLE messages ADD COLUMN languages TEXT NOT NULL DEFAULT '';
+    CREATE VIRTUAL TABLE messages_fts USING fts5(
+        content, languages, content='messages', content_rowid='rowid'
+    );
+    INSERT INTO messages_fts(messages_fts, rank) VALUES ('rank', 'bm25(1.0, 2.0)');
+    CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts(rowid, content, languages) VALUES (new.rowid, new.content, new.languages);
+    END;
+    CREATE TRIGGER messages_fts_delete AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content, languages)
+        VALUES ('delete', old.rowid, old.content, old.languages);
+    END;
+    CREATE TRIGGER messages_fts_update AFTER UPDATE OF content, languages ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content, languages)
+        VALUES ('delete', old.rowid, old.content, old.languages);
+        INSERT INTO messages_fts(rowid, content, languages) VALUES (new.rowid, new.content, new.languages);
+    END;
+    CREATE VIRTUAL TABLE sessions_fts USING fts5(title, content='sessions', content_rowid='rowid');
+    CREATE TRIGGER sessions_fts_insert AFTER INSERT ON sessions BEGIN
+        INSERT INTO sessions_fts(rowid, title) VALUES (new.rowid, new.title);
+    END;
+    CREATE TRIGGER sessions_fts_delete AFTER DELETE ON sessions BEGIN
+        INSERT INTO sessions_fts(sessions_fts, rowid, title) VALUES ('delete', old.rowid, old.title);
+    END;
+    CREATE TRIGGER sessions_fts_update AFTER UPDATE OF title ON sessions BEGIN
+        INSERT INTO sessions_fts(sessions_fts, rowid, title) VALUES ('delete', old.rowid, old.title);
+        INSERT INTO sessions_fts(rowid, title) VALUES (new.rowid, new.title);
+    END;
+    INSERT INTO messages_fts(messages_fts) VALUES ('rebuild');
+    INSERT INTO sessions_fts(sessions_fts) VALUES ('rebuild');
+    """,
+    backfill_message_languages,
+    compact_message_rows,
+)
+SCHEMA_VERSION = len(MIGRATIONS)
+
+# Number of search results returned by default
+SEARCH_LIMIT = 20
+
+# Maximum number of sessions whose messages are kept in memory per process,
+# across every store
+MAX_CACHED_SESSIONS = 64
+
+# Maximum number of stores (e.g. per-user shards) kept open per process;
+# the least recently used one is closed beyond this once nobody is using it
+MAX_OPEN_STORES = 256
+
+# Keys kept in the session index (everything except the messages)
+INDEX_FIELDS = ('id', 'title', 'created_at', 'last_updated')
+
+
+# Function to turn free text into an FTS5 query: every word must match, and
+# the last one may be a prefix so results show up while typing
+def fts_query(text):
+    words = [word.replace('"', '""') for word in text.split()]
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+# Function to cut a short excerpt around the first match of a word, with
+# the match in **bold** like the FTS5 snippets
+def json_snippet(content, word, width=60):
+    position = content.lower().find(word)
+    if position < 0:
+        return content[:width * 2]
+    start = max(0, position - width)
+    end = position + len(word)
+    prefix = "…" if start else ""
+    suffix = "…" if end + width < len(content) else ""
+    return (prefix + content[start:position] + "**" + content[position:end] + "**" +
+            content[end:end + width] + suffix)
+
+
+# Bounded LRU mapping (store path, session_id) -> (store serial, data
+# version, list of messages)
+class SessionCache:
+    def __init__(self, maxsize=MAX_CACHED_SESSIONS):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            messages = self._items.get(key)
+            if messages is not None:
+                self._items.move_to_end(key)
+            return messages
+
+    def put(self, key, messages):
+        with self._lock:
+            self._items[key] = messages
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def __len__(self):
+        return len(self._items)
+
+
+# Function to format a session timestamp for display
+def format_date(timestamp):
+    try:
+        return datetime.fromisoformat(timestamp).strftime("%b %d, %Y")
+    except (TypeError, ValueError):
+        return ""
+
+
+# Session ids ordered by last update, kept sorted as sessions are saved so
+# listing the most recent ones never sorts the whole index. A save moves one
+# entry (a binary search plus a list shift) and formats its date once.
+class RecencyIndex:
+    def __init__(self, sessions=()):
+        self._keys = {session['id']: (session['last_updated'], session['id']) for session in sessions}
+        self._order = sorted(self._keys.values())
+        self._dates = {session_id: format_date(key[0]) for session_id, key in self._keys.items()}
+
+    def put(self, session):
+        key = (session['last_updated'], session['id'])
+        old = self._keys.get(session['id'])
+        if old == key:
+            return
+        if old is not None:
+            del self._order[bisect_left(self._order, old)]
+        insort(self._order, key)
+        self._keys[session['id']] = key
+        self._dates[session['id']] = format_date(session['last_updated'])
+
+    def remove(self, session_id):
+        old = self._keys.pop(session_id, None)
+        if old is not None:
+            del self._order[bisect_left(self._order, old)]
+            del self._dates[session_id]
+
+    # Return up to limit session ids, most recent first, skipping offset
+    def most_recent(self, offset=0, limit=None):
+        end = len(self._order) - offset
+        start = 0 if limit is None else max(0, end - limit)
+        return [session_id for _, session_id in reversed(self._order[start:max(0, end)])]
+
+    def date(self, session_id):
+        return self._dates[session_id]
+
+    def __len__(self):
+        return len(self._order)
+
+
+# Base class for session storage backends. The session index is parsed once
+# per process and shared by every caller until the underlying data changes.
+class SessionStore:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._index = None
+        self._index_key = None
+        self._recency = None
+        self.index_loads = 0
+        self.index_hits = 0
+
+    # Return a dict of session_id -> session metadata (without messages).
+    # The dict is shared, so callers must go through the store to change it.
+    def load_index(self):
+        with self._lock:
+            key = self._change_key()
+            if self._index is not None and key == self._index_key:
+                self.index_hits += 1
+                return self._index
+            self._index = self._read_index()
+            self._index_key = key
+            self._recency = RecencyIndex(self._index.values())
+            self.index_loads += 1
+            return self._index
+
+    # Return (sessions, total): up to limit sessions, most recently updated
+    # first and skipping offset, each with its last update formatted as
+    # 'date'
+    def recent_sessions(self, offset=0, limit=None):
+        with self._lock:
+            index = self.load_index()
+            return ([dict(index[session_id], date=self._recency.date(session_id))
+                     for session_id in self._recency.most_recent(offset, limit)], len(index))
+
+    # Drop the cached index so the next load re-reads it
+    def invalidate(self):
+        with self._lock:
+            self._index = None
+            self._index_key = None
+            self._recency = None
+
+    # Token that changes whenever another writer modifies the data
+    def _change_key(self):
+        raise NotImplementedError
+
+    def _read_index(self):
+        raise NotImplementedError
+
+    # Drop the shared index if another writer changed the data since it was
+    # read. Called under the write lock before our own write, so patching
+    # the index afterwards can't hide the other writer's change.
+    def _check_index(self):
+        if self._index is not None and self._index_key != self._change_key():
+            self.invalidate()
+
+    # Keep the shared index in step with our own writes. change_key must be
+    # read while the write lock is still held: read after it is released, it
+    # could include another writer's change that the index doesn't have.
+    def _index_put(self, session, change_key):
+        if self._index is not None:
+            self._index[session['id']] = {key: session[key] for key in INDEX_FIELDS}
+            self._recency.put(session)
+            self._index_key = change_key
+
+    def _index_remove(self, session_id, change_key):
+        if self._index is not None:
+            self._index.pop(session_id, None)
+            self._recency.remove(session_id)
+            self._index_key = change_key
+
+    # Return the messages of a single session
+    def load_messages(self, session_id):
+        raise NotImplementedError
+
+    # Persist a session's metadata (title, timestamps)
+    def save_session_meta(self, session):
+        raise NotImplementedError
+
+    # Persist a session's messages: the ones not stored yet are appended, so
+    # messages another process saved meanwhile are never dropped. Removing
+    # messages goes through delete_messages().
+    def save_messages(self, session_id, messages):
+        raise NotImplementedError
+
+    # Remove messages from a session
+    def delete_messages(self, session_id, message_ids):
+        raise NotImplementedError
+
+    # Return (summary_text, upto_message_id) for a session's rolling summary
+    def load_summary(self, session_id):
+        raise NotImplementedError
+
+    # Persist a session's rolling summary, covering messages up to upto_id
+    def save_summary(self, session_id, summary, upto_id):
+        raise NotImplementedError
+
+    # Remove a session and all of its messages
+    def delete_session(self, session_id):
+        raise NotImplementedError
+
+    # Return up to limit search results for a query, best first, as dicts
+    # with session_id, title, message_id (None for title matches), role and
+    # a snippet with matches in **bold**
+    def search(self, query, limit=SEARCH_LIMIT):
+        raise NotImplementedError
+
+    # Reclaim space left behind by updates and deletes
+    def compact(self):
+        pass
+
+    def close(self):
+        pass
+
+
+# Function to hold an exclusive lock on a file across processes
+@contextmanager
+def file_lock(path):
+    with open(path, 'a+') as f:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+# Function to replace a file's contents atomically: readers see either the
+# old or the new file, never a partial write
+def atomic_write_json(path, data):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+# Legacy backend: every session lives in a single JSON file. Writes take a
+# lock file shared by every process, re-read the file if another writer
+# changed it, apply only the writer's session and replace the file
+# atomically, so concurrent writers never drop each other's sessions.
+class JsonSessionStore(SessionStore):
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.lock_path = path + ".lock"
+        self.sessions = None
+        self._sessions_key = None
+
+    def _load(self):
+        key = self._change_key()
+        if self.sessions is not None and key == self._sessions_key:
+            return self.sessions
+        if key is not None:
+            with open(self.path, 'r') as f:
+                self.sessions = json.load(f)
+        else:
+            self.sessions = {}
+        self._sessions_key = key
+        return self.sessions
+
+    # Yield the latest sessions under the lock and write them back when the
+    # block ends. The shared index only follows our write if it was current
+    # before it; otherwise it is dropped and re-read on the next load. The
+    # change key of our write is read before the file lock is released.
+    @contextmanager
+    def _update(self):
+        with self._lock, file_lock(self.lock_path):
+            self._check_index()
+            sessions = self._load()
+            yield sessions
+            atomic_write_json(self.path, sessions)
+            self._sessions_key = self._change_key()
+
+    def _change_key(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        # Every write replaces the file, so the inode changes even when the
+        # size and mtime happen to match
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _read_index(self):
+        self._load()
+        return {session_id: {key: session[key] for key in INDEX_FIELDS}
+                for session_id, session in self.sessions.items()}
+
+    def load_messages(self, session_id):
+        with self._lock:
+            session = self._load().get(session_id)
+            return [Message.from_dict(message) for message in session.get('messages', [])] if session else []
+
+    def save_session_meta(self, session):
+        with self._lock:
+            with self._update() as sessions:
+                stored = sessions.setdefault(session['id'], {'messages': []})
+                stored.update({key: session[key] for key in INDEX_FIELDS})
+            self._index_put(session, self._sessions_key)
+
+    def save_messages(self, session_id, messages):
+        with self._lock:
+            with self._update() as sessions:
+                if session_id in sessions:
+                    stored = sessions[session_id].setdefault('messages', [])
+                    stored_ids = {message['id'] for message in stored}
+                    stored.extend(message.to_dict() for message in messages if message.id not in stored_ids)
+            self._refresh_index_key()
+
+    def delete_messages(self, session_id, message_ids):
+        message_ids = set(message_ids)
+        with self._lock:
+            with self._update() as sessions:
+                if session_id in sessions:
+                    sessions[session_id]['messages'] = [message for message in sessions[session_id].get('messages', [])
+                                                        if message['id'] not in message_ids]
+            self._refresh_index_key()
+
+    def load_summary(self, session_id):
+        with self._lock:
+            session = self._load().get(session_id) or {}
+            return session.get('summary'), session.get('summary_upto')
+
+    def save_summary(self, session_id, summary, upto_id):
+        with self._lock:
+            with self._update() as sessions:
+                if session_id in sessions:
+                    sessions[session_id]['summary'] = summary
+                    sessions[session_id]['summary_upto'] = upto_id
+            self._refresh_index_key()
+
+    def delete_session(self, session_id):
+        with self._lock:
+            with self._update() as sessions:
+                sessions.pop(session_id, None)
+            self._index_remove(session_id, self._sessions_key)
+
+    # The JSON backend has no index, so search scans every message; titles
+    # are listed first, then messages in the order they were written
+    def search(self, query, limit=SEARCH_LIMIT):
+        words = query.lower().split()
+        if not words:
+            return []
+        title_hits = []
+        message_hits = []
+        with self._lock:
+            for session_id, session in self._load().items():
+                if all(word in session['title'].lower() for word in words):
+                    title_hits.append({'session_id': session_id, 'title': session['title'], 'message_id': None,
+                                       'role': None, 'snippet': session['title']})
+                for message in session.get('messages', []):
+                    text = (message['content'] + " " + message_languages(message['content'])).lower()
+                    if all(word in text for word in words):
+                        message_hits.append({'session_id': session_id, 'title': session['title'],
+                                             'message_id': message['id'], 'role': message['role'],
+                                             'snippet': json_snippet(message['content'], words[0])})
+        return (title_hits + message_hits)[:limit]
+
+    # Our own write doesn't change the index fields, so a current index
+    # stays current (_update read the key under the file lock)
+    def _refresh_index_key(self):
+        if self._index is not None:
+            self._index_key = self._sessions_key
+
+
+# Every SQLite store in the process shares one message cache, so opening
+# more stores (e.g. per-user shards) doesn't raise the memory bound
+_message_cache = SessionCache()
+
+# Numbers each store opened, since a reopened file's data versions start
+# over and must not match the entries cached by the store it replaced
+_store_serials = itertools.count()
+
+
+# SQLite backend: sessions and messages are rows, so a save only writes the
+# session that changed and appends the messages that are new. Only the
+# session index is read up front; messages are fetched per session and held
+# in a bounded LRU shared by every store.
+class SqliteSessionStore(SessionStore):
+    def __init__(self, path, legacy_json_path=None, cache=None):
+        super().__init__()
+        self.path = path
+        self._writes = 0
+        self.cache = _message_cache if cache is None else cache
+        self._serial = next(_store_serials)
+        self._conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # The search view and triggers decompress message bodies in SQL
+        self._conn.execute("PRAGMA trusted_schema=ON")
+        self._conn.create_function("message_text", 1, decompress_text, deterministic=True)
+        self._create_schema()
+        if legacy_json_path:
+            self.migrate_from_json(legacy_json_path)
+
+    # Each migration runs in its own write transaction and the version is
+    # re-read inside it, so processes starting together apply it only once
+    def _create_schema(self):
+        with self._lock:
+            for number in range(SCHEMA_VERSION):
+                if self._conn.execute("PRAGMA user_version").fetchone()[0] > number:
+                    continue
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    if self._conn.execute("PRAGMA user_version").fetchone()[0] == number:
+                        migration = MIGRATIONS[number]
+                        if callable(migration):
+                            migration(self._conn)
+                        else:
+                            for statement in split_statements(migration):
+                                self._conn.execute(statement)
+                        self._conn.execute(f"PRAGMA user_version={number + 1}")
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+
+    # Import sessions from the legacy JSON file into an empty database and
+    # rename the file so the import only ever happens once
+    def migrate_from_json(self, json_path):
+        if not os.path.exists(json_path):
+            return 0
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM sessions LIMIT 1").fetchone():
+                return 0
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Another process may have imported (and renamed) the file
+                # while we waited for the write lock
+                if self._conn.execute("SELECT 1 FROM sessions LIMIT 1").fetchone() or \
+                        not os.path.exists(json_path):
+                    self._conn.execute("ROLLBACK")
+                    return 0
+                with open(json_path, 'r') as f:
+                    sessions = json.load(f)
+                for session in sessions.values():
+                    self._upsert_meta(session)
+                    self._insert_messages(session['id'], [Message.from_dict(message)
+                                                          for message in session.get('messages', [])], 0)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        os.replace(json_path, json_path + ".migrated")
+        return len(sessions)
+
+    # data_version only changes when another connection commits, so our own
+    # writes never force a re-read
+    def _change_key(self):
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _read_index(self):
+        return {
+            row[0]: {
+                'id': row[0],
+                'title': row[1],
+                'created_at': row[2],
+                'last_updated': row[3]
+            }
+            for row in self._conn.execute(
+                "SELECT id, title, created_at, last_updated FROM sessions")
+        }
+
+    # Cached messages are only used while no other process has committed
+    # since they were read (the version is read before the rows, so a commit
+    # in between only causes an extra re-read). Callers get their own list
+    # so appending to it never touches the cache.
+    def load_messages(self, session_id):
+        with self._lock:
+            version = self._change_key()
+            cached = self.cache.get((self.path, session_id))
+            if cached is not None and cached[:2] == (self._serial, version):
+                return list(cached[2])
+            messages = [
+                Message(row[0], row[1], decompress_text(row[2]), row[3])
+                for row in self._conn.execute(
+                    "SELECT id, role, body, created FROM messages "
+                    "WHERE session_id = ? ORDER BY seq", (session_id,))
+            ]
+            self.cache.put((self.path, session_id), (self._serial, version, messages))
+        return list(messages)
+
+    # The index is checked inside the write transaction, where no other
+    # connection can commit, so a foreign write drops it instead of being
+    # hidden by our patch
+    def save_session_meta(self, session):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._check_index()
+                self._upsert_meta(session)
+                # Our own commit doesn't change data_version, so the value
+                # read now is the one the index will be current for
+                change_key = self._change_key()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._index_put(session, change_key)
+            self._after_write()
+
+    def save_messages(self, session_id, messages):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                version = self._change_key()
+                stored_ids = self._sync_messages(session_id, messages)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            if stored_ids == [message.id for message in messages]:
+                self.cache.put((self.path, session_id), (self._serial, version, list(messages)))
+            else:
+                # Another writer's messages were kept; re-read on next load
+                self.cache.discard((self.path, session_id))
+            self._after_write()
+
+    def delete_messages(self, session_id, message_ids):
+        with self._lock:
+            self._conn.executemany("DELETE FROM messages WHERE session_id = ? AND id = ?",
+                                   [(session_id, message_id) for message_id in message_ids])
+            self.cache.discard((self.path, session_id))
+            self._after_write()
+
+    def load_summary(self, session_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT summary, summary_upto FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return tuple(row) if row else (None, None)
+
+    def save_summary(self, session_id, summary, upto_id):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE sessions SET summary = ?, summary_upto = ? WHERE id = ?",
+                (summary, upto_id, session_id))
+            self._after_write()
+
+    def delete_session(self, session_id):
+        self.cache.discard((self.path, session_id))
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._check_index()
+                self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+                self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+                change_key = self._change_key()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._index_remove(session_id, change_key)
+            self._after_write()
+
+    # Title matches rank above message matches; both are ranked by BM25, with
+    # code block languages weighted over message text. Only the matching
+    # rows are read, never whole sessions.
+    def search(self, query, limit=SEARCH_LIMIT):
+        match = fts_query(query)
+        if match is None:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT s.id, s.title, NULL, NULL, highlight(sessions_fts, 0, '**', '**') "
+                "FROM sessions_fts JOIN sessions s ON s.rowid = sessions_fts.rowid "
+                "WHERE sessions_fts MATCH ? ORDER BY rank LIMIT ?",
+                (match, limit)).fetchall()
+            rows += self._conn.execute(
+                "SELECT s.id, s.title, m.id, m.role, "
+                "snippet(messages_fts, 0, '**', '**', '…', 12) "
+                "FROM messages_fts JOIN messages m ON m.rowid = messages_fts.rowid "
+                "JOIN sessions s ON s.id = m.session_id "
+                "WHERE messages_fts MATCH ? ORDER BY rank LIMIT ?",
+                (match, limit)).fetchall()
+        return [{'session_id': row[0], 'title': row[1], 'message_id': row[2],
+                 'role': None if row[3] is None else Role(row[3]).name.lower(), 'snippet': row[4]}
+                for row in rows[:limit]]
+
+    # Checkpoint the WAL and vacuum once enough pages are free
+    def compact(self):
+        with self._lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            page_count = self._conn.execute("PRAGMA page_count").fetchone()[0]
+            free_pages = self._conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if page_count and free_pages * 4 > page_count:
+                self._conn.execute("VACUUM")
+                # VACUUM may renumber the rowids the search index points at
+                self._conn.execute("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+                self._conn.execute("INSERT INTO sessions_fts(sessions_fts) VALUES ('rebuild')")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _after_write(self):
+        self._writes += 1
+        if self._writes % COMPACT_EVERY == 0:
+            self.compact()
+
+    def _upsert_meta(self, session):
+        self._conn.execute(
+            "INSERT INTO sessions (id, title, created_at, last_updated) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET title = excluded.title, "
+            "last_updated = excluded.last_updated",
+            (session['id'], session['title'], session['created_at'], session['last_updated'])
+        )
+
+    # Append the messages that aren't stored yet, after whatever is stored,
+    # so messages another process added meanwhile are kept. Returns the
+    # stored message ids.
+    def _sync_messages(self, session_id, messages):
+        rows = self._conn.execute(
+            "SELECT id, seq FROM messages WHERE session_id = ? ORDER BY seq", (session_id,)).fetchall()
+        stored_ids = [row[0] for row in rows]
+        stored = set(stored_ids)
+        added = [message for message in messages if message.id not in stored]
+        self._insert_messages(session_id, added, rows[-1][1] + 1 if rows else 0)
+        return stored_ids + [message.id for message in added]
+
+    def _insert_messages(self, session_id, messages, start_seq):
+        self._conn.executemany(
+            "INSERT INTO messages (session_id, seq, id, role, body, created, languages) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(session_id, start_seq + i, m.id, int(m.role), compress_text(m.content), m.created,
+              message_languages(m.content))
+             for i, m in enumerate(messages)]
+        )
+
+
+# Stores are kept per process so every Streamlit rerun reuses the same
+# connection instead of reopening the database. Callers using a store are
+# counted, so a store evicted while in use is only closed once they are done.
+_stores = OrderedDict()
+_store_users = {}
+_evicted_stores = set()
+_stores_lock = threading.Lock()
+
+
+# Function to use the store for a backend and path for the duration of a
+# with block, opening it on first use
+@contextmanager
+def open_store(backend, path, legacy_json_path=None):
+    store = _acquire_store(backend, path, legacy_json_path)
+    try:
+        yield store
+    finally:
+        _release_store(store)
+
+
+def _acquire_store(backend, path, legacy_json_path):
+    key = (backend, path)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is not None:
+            _stores.move_to_end(key)
+        else:
+            if backend == "json":
+                store = JsonSessionStore(path)
+            elif backend == "sqlite":
+                store = SqliteSessionStore(path, legacy_json_path=legacy_json_path)
+            else:
+                raise ValueError(f"Unknown session store backend: {backend}")
+            _stores[key] = store
+            while len(_stores) > MAX_OPEN_STORES:
+                evicted = _stores.popitem(last=False)[1]
+                if evicted in _store_users:
+                    _evicted_stores.add(evicted)
+                else:
+                    evicted.close()
+        _store_users[store] = _store_users.get(store, 0) + 1
+        return store
+
+
+def _release_store(store):
+    with _stores_lock:
+        _store_users[store] -= 1
+        if _store_users[store]:
+            return
+        del _store_users[store]
+        if store in _evicted_stores:
+            _evicted_stores.discard(store)
+            store.close()
@@ -0,0 +1,63 @@
+import threading
+from concurrent.futures import Future
+
+import metrics
+
+
+# Error given to waiting callers when the leader is interrupted (e.g. its
+# script run is stopped) rather than failing
+INTERRUPTED = RuntimeError("The shared request was interrupted")
+
+
+# Coalesces concurrent calls with the same key: the first caller (the
+# leader) does the work and every caller that arrives while it is in flight
+# waits for and shares its result or error. Nothing is kept once the call
+# finishes; repeats after that are left to the response cache.
+class SingleFlight:
+    def __init__(self, name="singleflight"):
+        self.name = name
+        self.leaders = 0
+        self.coalesced = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    # Function to join the call in flight for a key, or start one. Returns
+    # (future, leader); a leader must call finish() when it is done.
+    def begin(self, key):
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                future = Future()
+                self._calls[key] = future
+                self.leaders += 1
+                leader = True
+        metrics.increment(f"{self.name}.leaders" if leader else f"{self.name}.coalesced")
+        return future, leader
+
+    # Function to publish a leader's result (or error) to the waiting callers
+    def finish(self, key, result=None, error=None):
+        with self._lock:
+            future = self._calls.pop(key)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    # Function to run fn() once for all concurrent callers with the same key
+    def do(self, key, fn):
+        future, leader = self.begin(key)
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+        except Exception as e:
+            self.finish(key, error=e)
+            raise
+        except BaseException:
+            self.finish(key, error=INTERRUPTED)
+            raise
+        self.finish(key, result)
+        return result
@@ -0,0 +1,66 @@
+import pytest
+
+from classifier import classify, is_code_request
+
+CODE_PROMPTS = (
+    "Create a Python function to find prime numbers",
+    "Write HTML and CSS for a responsive navigation bar",
+    "Build a Flask API with a POST endpoint to accept JSON data",
+    "Write a Go program that reads a file",
+    "Make me a todo app",
+    "Add two more classes to it",
+    "implementing a linked list in C",
+    "coding a game",
+    "Help me with programming a calculator",
+    "I'm developing a chat bot for my team",
+    "Can you help me with building a website?",
+    "Why isn't this coded right?",
+    "Fix the bugs in my scripts",
+    "Create an endpoint that returns users",
+    "Write an async web scraper",
+    "Generate an ERD for orders",
+)
+
+NON_CODE_PROMPTS = (
+    "What is the difference between a list and a tuple?",
+    "Tell me about the history of the internet",
+    "Explain how classes work",
+    "Describe the advantages of Python",
+    "I feel good today, any tips for staying happy?",
+    "I watched some classic films last night",
+    "The barcode on this box is smudged",
+    "Thanks, that was very helpful",
+)
+
+
+@pytest.mark.parametrize("prompt", CODE_PROMPTS)
+def test_code_requests(prompt):
+    assert is_code_request(prompt)
+    assert classify(prompt).is_code
+
+
+@pytest.mark.parametrize("prompt", NON_CODE_PROMPTS)
+def test_non_code_requests(prompt):
+    assert not is_code_request(prompt)
+    assert not classify(prompt).is_code
+
+
+def test_short_keywords_match_whole_words():
+    assert classify("go build it").code_terms == ["go", "build"]
+    assert classify("a good, happy gopher").code_terms == []
+
+
+def test_verbs_match_any_ending():
+    assert classify("implements programmers develops builder codes").code_terms == [
+        "implements", "programmers", "develops", "builder", "codes"]
+
+
+def test_non_code_terms_are_reported():
+    result = classify("Explain how this Python function works")
+    assert result.code_terms == ["python", "function"]
+    assert result.non_code_terms == ["explain"]
+
+
+def test_phrases_match_before_an():
+    assert classify("Create an endpoint").code_terms == ["create an"]
+    assert classify("write a parser and generate an index").code_terms == ["write a", "generate an"]
@@ -0,0 +1,38 @@
+import pytest
+
+import engine
+
+HISTORY = (
+    {'role': 'user', 'content': "Write a Python function to reverse a string"},
+    {'role': 'assistant', 'content': "```python\ndef reverse(text):\n    return text[::-1]\n```"},
+)
+
+FOLLOW_UPS = (
+    "Now add error handling to it",
+    "Make it async",
+    "Can you rename the argument?",
+    "please convert this to a lambda",
+    "I need this to support unicode",
+)
+
+NOT_FOLLOW_UPS = (
+    "Thanks, that was very helpful",
+    "Great, see you tomorrow",
+    "Does it run on Windows?",
+    "Explain how it works",
+)
+
+
+@pytest.mark.parametrize("prompt", FOLLOW_UPS)
+def test_edit_follow_ups_want_code(prompt):
+    assert engine.is_follow_up_request(prompt, list(HISTORY))
+    assert engine.wants_code(prompt, HISTORY)
+
+
+@pytest.mark.parametrize("prompt", NOT_FOLLOW_UPS)
+def test_other_replies_after_code_are_chat(prompt):
+    assert not engine.wants_code(prompt, HISTORY)
+
+
+def test_follow_up_needs_code_in_recent_history():
+    assert not engine.wants_code("Make it async", HISTORY[:1])
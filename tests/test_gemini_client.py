@@ -0,0 +1,57 @@
+import time
+
+import pytest
+
+import gemini_client
+from fake_model import FakeModel
+from gemini_client import CircuitBreaker, CircuitOpenError, ConcurrencyLimiter, GeminiClient, ModelTimeoutError
+
+COOLDOWN = 0.05
+
+
+# Function to build a client whose breaker is ready for its half-open trial
+def half_open_client(limiter=None):
+    breaker = CircuitBreaker(threshold=1, cooldown=COOLDOWN)
+    breaker.record_failure()
+    time.sleep(COOLDOWN)
+    model = FakeModel(latency=0, tokens_per_second=1e6, chunk_tokens=2)
+    return GeminiClient(model, limiter=limiter or ConcurrencyLimiter(), breaker=breaker, name="test")
+
+
+def test_trial_success_closes_circuit():
+    client = half_open_client()
+    client.generate_sync("Write a Python function", timeout=5)
+    assert client.breaker.state == "closed"
+
+
+def test_trial_timing_out_on_limiter_reopens_circuit():
+    limiter = ConcurrencyLimiter(1)
+    client = half_open_client(limiter)
+    gemini_client.run_sync(limiter.acquire())
+    try:
+        with pytest.raises(ModelTimeoutError):
+            client.generate_sync("Write a Python function", timeout=0.05)
+    finally:
+        gemini_client.get_loop().call_soon_threadsafe(limiter.release)
+    assert client.breaker.state == "open"
+
+    # Calls fail fast until the cooldown, then a new trial gets through
+    with pytest.raises(CircuitOpenError):
+        client.generate_sync("Write a Python function", timeout=5)
+    time.sleep(COOLDOWN)
+    client.generate_sync("Write a Python function", timeout=5)
+    assert client.breaker.state == "closed"
+
+
+def test_trial_stream_closed_early_reopens_circuit():
+    limiter = ConcurrencyLimiter(1)
+    client = half_open_client(limiter)
+    chunks = client.stream_sync("Write a Python function", timeout=5)
+    next(chunks)
+    chunks.close()
+    assert client.breaker.state == "open"
+
+    # The limiter slot was released too
+    time.sleep(COOLDOWN)
+    assert "".join(client.stream_sync("Write a Python function", timeout=5))
+    assert client.breaker.state == "closed"
@@ -0,0 +1,34 @@
+from router import SLOW_LATENCY_FACTOR, TASK_SNIPPET, ModelRouter
+
+ROUTES = {TASK_SNIPPET: ('primary', 'fallback')}
+
+
+def test_candidates_keep_route_order_by_default():
+    router = ModelRouter(ROUTES)
+    assert router.candidates(TASK_SNIPPET) == ['primary', 'fallback']
+    router.record('primary', 1.0, True)
+    router.record('fallback', 0.5, True)
+    assert router.candidates(TASK_SNIPPET) == ['primary', 'fallback']
+
+
+def test_much_slower_primary_is_tried_after_fallback():
+    router = ModelRouter(ROUTES)
+    router.record('fallback', 1.0, True)
+    router.record('primary', SLOW_LATENCY_FACTOR * 1.0 + 1, True)
+    assert router.candidates(TASK_SNIPPET) == ['fallback', 'primary']
+
+
+def test_unhealthy_fallback_doesnt_demote_slow_primary():
+    router = ModelRouter(ROUTES)
+    router.record('fallback', 1.0, True)
+    router.record('primary', SLOW_LATENCY_FACTOR * 1.0 + 1, True)
+    for _ in range(5):
+        router.record('fallback', 0.1, False)
+    assert router.candidates(TASK_SNIPPET) == ['primary', 'fallback']
+
+
+def test_failing_primary_goes_last():
+    router = ModelRouter(ROUTES)
+    for _ in range(5):
+        router.record('primary', 0.1, False)
+    assert router.candidates(TASK_SNIPPET) == ['fallback', 'primary']
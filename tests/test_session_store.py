@@ -0,0 +1,56 @@
+import pytest
+
+from session_store import JsonSessionStore, SqliteSessionStore
+
+BACKENDS = {'sqlite': (SqliteSessionStore, "sessions.db"), 'json': (JsonSessionStore, "sessions.json")}
+
+
+def make_session(session_id, day=1):
+    timestamp = f"2024-01-{day:02d}T00:00:00"
+    return {'id': session_id, 'title': session_id, 'created_at': timestamp, 'last_updated': timestamp}
+
+
+# Function to open two stores on the same file, standing in for two processes
+@pytest.fixture(params=sorted(BACKENDS))
+def stores(request, tmp_path):
+    store_class, name = BACKENDS[request.param]
+    path = str(tmp_path / name)
+    ours, theirs = store_class(path), store_class(path)
+    yield ours, theirs
+    ours.close()
+    theirs.close()
+
+
+def test_index_sees_writes_made_before_ours(stores):
+    ours, theirs = stores
+    ours.save_session_meta(make_session("a"))
+    ours.load_index()
+    theirs.save_session_meta(make_session("foreign", 2))
+    ours.save_session_meta(make_session("b", 3))
+    assert sorted(ours.load_index()) == ["a", "b", "foreign"]
+
+
+@pytest.mark.parametrize("write", ["save", "delete"])
+def test_index_sees_writes_made_right_after_ours(stores, write):
+    ours, theirs = stores
+    ours.save_session_meta(make_session("a"))
+    ours.save_session_meta(make_session("b", 2))
+    ours.load_index()
+
+    # Another process commits between our write and the index update
+    for name in ("_index_put", "_index_remove"):
+        original = getattr(ours, name)
+
+        def patched(*args, original=original):
+            theirs.save_session_meta(make_session("foreign", 3))
+            original(*args)
+        setattr(ours, name, patched)
+
+    if write == "save":
+        ours.save_session_meta(make_session("c", 4))
+        expected = ["a", "b", "c", "foreign"]
+    else:
+        ours.delete_session("b")
+        expected = ["a", "foreign"]
+    assert sorted(ours.load_index()) == expected
+    assert sorted(session['id'] for session in ours.recent_sessions()[0]) == expected